@@ -1,10 +1,12 @@
 # backend/app.py
-from flask import Flask, request, jsonify, render_template, send_from_directory, abort
+from flask import Flask, request, jsonify, render_template, send_from_directory, send_file, abort
 from flask_cors import CORS
 from pathlib import Path
-import os, json, math, heapq, logging
-from shapely.geometry import shape, Point
-from shapely.ops import unary_union
+import os, math, heapq, logging
+from shapely.geometry import Point
+
+from geodata import load_or_ingest, dumps
+from assets import AssetStore
 
 # ---------- App root / data paths ----------
 APP_ROOT = Path(__file__).parent
@@ -16,10 +18,13 @@ PORTS_FILE = DATA_DIR / "ports.geojson"
 ISLANDS_FILE = DATA_DIR / "islands.geojson"
 LAND_FILE = DATA_DIR / "land.geojson"
 ROCKS_FILE = DATA_DIR / "rocks.geojson"
+GEODATA_FILE = DATA_DIR / "cache" / "geodata.npz"
+ASSETS_DIR = DATA_DIR / "cache" / "assets"
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
-app = Flask(__name__, template_folder=str(TEMPLATE_DIR), static_folder=str(STATIC_DIR))
+# /static is served by serve_static below (precompressed, content-hashed assets)
+app = Flask(__name__, template_folder=str(TEMPLATE_DIR), static_folder=None)
 CORS(app)
 logging.basicConfig(level=logging.INFO)
 
@@ -49,43 +54,21 @@ def grid_to_latlon(r, c):
     lon = SEA_BOUNDS["lon_min"] + c * GRID_RES + GRID_RES/2.0
     return lat, lon
 
-def load_json(path):
-    if not os.path.exists(path):
-        return {}
-    with open(path, encoding="utf-8") as f:
-        return json.load(f)
-
 # ---------- Load static data ----------
-ISLANDS = load_json(ISLANDS_FILE) or {"type":"FeatureCollection","features":[]}
-LAND = load_json(LAND_FILE) or {"type":"FeatureCollection","features":[]}
-ROCKS_RAW = load_json(ROCKS_FILE) or {"elements":[]}
-PORTS_RAW = load_json(PORTS_FILE) or {"elements":[]}
-
-ROCKS = []
-for e in ROCKS_RAW.get("elements", []):
-    if e.get("type") == "node" and "lat" in e and "lon" in e:
-        ROCKS.append({"lat": e["lat"], "lon": e["lon"], "name": e.get("tags", {}).get("name","rock")})
-
-PORTS = []
-if isinstance(PORTS_RAW, dict) and "elements" in PORTS_RAW:
-    for e in PORTS_RAW.get("elements", []):
-        if e.get("type") == "node":
-            PORTS.append({"lat": e["lat"], "lon": e["lon"], "name": e.get("tags", {}).get("name","port")})
-elif isinstance(PORTS_RAW, dict) and PORTS_RAW.get("type") == "FeatureCollection":
-    for feat in PORTS_RAW.get("features", []):
-        geom = feat.get("geometry", {})
-        if geom.get("type") == "Point":
-            lon, lat = geom["coordinates"]
-            PORTS.append({"lat": lat, "lon": lon, "name": feat.get("properties", {}).get("name","port")})
+# Columnar obstacle / rock / port tables shared with app1 (geodata.py)
+GEODATA = load_or_ingest(GEODATA_FILE, [ISLANDS_FILE, LAND_FILE], ROCKS_FILE, PORTS_FILE)
+ROCKS = GEODATA.rocks
+PORTS = GEODATA.ports
+ISLAND_FEATURES = GEODATA.obstacles.features_json()
+
+# Frontend and /data files with precompressed variants and content-hashed URLs (assets.py)
+ASSETS = AssetStore(ASSETS_DIR)
+ASSETS.add_directory("/static", STATIC_DIR)
+ASSETS.add_directory("/data", DATA_DIR, recursive=False)
+ASSETS.build()
 
 # unify obstacles
-ALL_ISLAND_FEATURES = []
-if ISLANDS.get("type") == "FeatureCollection":
-    ALL_ISLAND_FEATURES += ISLANDS.get("features", [])
-if LAND.get("type") == "FeatureCollection":
-    ALL_ISLAND_FEATURES += LAND.get("features", [])
-
-OBSTACLES_UNION = unary_union([shape(f["geometry"]) for f in ALL_ISLAND_FEATURES if f.get("geometry")])
+OBSTACLES_UNION = GEODATA.obstacles.union()
 
 # ---------- Mock AIS ----------
 def get_ships_near_area(lat_min, lat_max, lon_min, lon_max):
@@ -207,8 +190,8 @@ def build_weight_grid(rmin, rmax, cmin, cmax, dynamic_ships=None, buffer_cells=1
             if OBSTACLES_UNION.contains(pt):
                 grid[r][c] = 1e9
 
-    for rock in ROCKS:
-        rr, cc = latlon_to_grid(rock["lat"], rock["lon"])
+    for lat, lon in zip(ROCKS.lat.tolist(), ROCKS.lon.tolist()):
+        rr, cc = latlon_to_grid(lat, lon)
         if rmin <= rr <= rmax and cmin <= cc <= cmax:
             grid[rr-rmin][cc-cmin] = 1e9
 
@@ -270,13 +253,13 @@ def weighted_a_star_sub(start_latlon, end_latlon, grid, rmin, cmin, Rn, Cn):
 # ---------- API ----------
 @app.route("/api/ports")
 def api_ports():
-    return jsonify(PORTS)
+    return jsonify(PORTS.records())
 
 @app.route("/api/optimize-route", methods=["POST"])
 def api_optimize():
     payload = request.get_json() or {}
-    origin = next((p for p in PORTS if payload.get("origin","").lower() in p["name"].lower()), None)
-    dest = next((p for p in PORTS if payload.get("destination","").lower() in p["name"].lower()), None)
+    origin = PORTS.find(payload.get("origin",""))
+    dest = PORTS.find(payload.get("destination",""))
     if not origin or not dest:
         return jsonify({"error":"port not found"}), 400
 
@@ -315,33 +298,50 @@ def api_optimize():
     )
 
     # 转换障碍物
-    rocks_features = [
-        {"type":"Feature","properties":{"name":r["name"]},
-         "geometry":{"type":"Point","coordinates":[r["lon"],r["lat"]]}}
-        for r in ROCKS
-    ]
     ships_features = [
         {"type":"Feature","properties":{"name":s["name"]},
          "geometry":{"type":"Point","coordinates":[s["lon"],s["lat"]]}}
         for s in ships
     ]
 
-    return jsonify({
+    return app.response_class(dumps({
         "main_route": [{"lat": round(p[0],6), "lon": round(p[1],6)} for p in path_main],
         "alt_route": (
             [{"lat": round(p[0],6), "lon": round(p[1],6)} for p in path_alt]
             if path_alt else []
         ),
         "obstacles": {
-            "islands": ALL_ISLAND_FEATURES,
-            "rocks": rocks_features,
+            "islands": ISLAND_FEATURES,
+            "rocks": ROCKS.features_json(),
             "ships": ships_features
         }
-    })
+    }), mimetype="application/json")
+
 
+def asset_response(url):
+    """Precompressed file response for a registered asset (304 when the client
+    has it), or None for unknown URLs."""
+    asset, immutable = ASSETS.lookup(url)
+    if asset is None:
+        return None
+    path, encoding = ASSETS.negotiate(asset, request.headers.get("Accept-Encoding"))
+    if ASSETS.not_modified(asset, request.headers.get("If-None-Match")):
+        headers = ASSETS.headers(asset, immutable)
+        headers["ETag"] = asset.etag(encoding)
+        return app.response_class(status=304, headers=headers)
+    response = send_file(path, mimetype=asset.media_type, etag=False, conditional=True)
+    response.headers.update(ASSETS.headers(asset, immutable, encoding))
+    return response
+
+@app.route("/static/<path:filename>", endpoint="static")
+def serve_static(filename):
+    return asset_response(f"/static/{filename}") or send_from_directory(STATIC_DIR, filename)
 
 @app.route("/data/<path:filename>")
 def serve_data(filename):
+    response = asset_response(f"/data/{filename}")
+    if response is not None:
+        return response
     file_path = DATA_DIR / filename
     if not file_path.exists():
         abort(404)
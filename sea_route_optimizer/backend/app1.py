@@ -1,15 +1,33 @@
 # backend/main.py
-import os, json, math, heapq, logging
+import os, math, heapq, itertools, logging, time
+from contextlib import asynccontextmanager
+import numpy as np
 from pathlib import Path
 from typing import Optional, List
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, Request, HTTPException, Depends
+from fastapi.responses import Response, JSONResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.routing import Match
 from pydantic import BaseModel
-from shapely.geometry import shape, Point
-from shapely.ops import unary_union
+from shapely.geometry import Point
 import requests
 
+from grid_pyramid import load_or_build_pyramid, pyramid_cache_key, coarse_to_fine, alternative_cells, cells_to_latlon
+from navmesh import load_or_build_navmesh, iter_navmesh_routes
+from visgraph import load_or_build_visgraph, iter_visgraph_routes
+from path_simplify import ClearanceIndex, simplify_path, encode_route, ROUTE_FORMATS
+from fleet_emissions import FleetTables, parse_batch, stream_ndjson
+from speed_optimizer import SpeedCurves, optimize_speed_plan
+from weather_cache import WeatherCache, wave_resistance
+from voyage_pipeline import route_segments, segment_emissions
+from compliance import ComplianceEngine
+from geodata import load_or_ingest, dumps
+from landmarks import SeaGrid, load_or_build_landmarks, bidirectional_search
+from assets import AssetStore
+from metrics import MetricsRegistry, begin_request, end_request, stage, search_stats
+from profiling import ProfileStore, profiled, is_profiled, profile_requested, build_profile
+from scheduler import Scheduler, Overloaded, estimate_route_cost, route_class
+
 # ----------------------------
 # App paths and data setup
 # ----------------------------
@@ -23,6 +41,16 @@ PORTS_FILE = DATA_DIR / "ports.geojson"
 ISLANDS_FILE = DATA_DIR / "islands.geojson"
 LAND_FILE = DATA_DIR / "land.geojson"
 ROCKS_FILE = DATA_DIR / "rocks.geojson"
+CACHE_DIR = DATA_DIR / "cache"
+GEODATA_FILE = CACHE_DIR / "geodata.npz"
+PYRAMID_FILE = CACHE_DIR / "grid_pyramid.npz"
+NAVMESH_FILE = CACHE_DIR / "navmesh.npz"
+VISGRAPH_FILE = CACHE_DIR / "visgraph.npz"
+LANDMARKS_FILE = CACHE_DIR / "landmarks.npy"
+ASSETS_DIR = CACHE_DIR / "assets"
+COMPLIANCE_RULES_FILE = DATA_DIR / "compliance_rules.json"
+GEOFENCES_FILE = DATA_DIR / "geofences.geojson"
+PROFILE_DIR = DATA_DIR / "profiles"
 
 os.makedirs(DATA_DIR, exist_ok=True)
 logging.basicConfig(level=logging.INFO)
@@ -57,43 +85,45 @@ def grid_to_latlon(r, c):
     lon = SEA_BOUNDS["lon_min"] + c * GRID_RES + GRID_RES/2.0
     return lat, lon
 
-def load_json(path):
-    if not os.path.exists(path):
-        return {}
-    with open(path, encoding="utf-8") as f:
-        return json.load(f)
-
 # ----------------------------
 # Load static data
 # ----------------------------
-ISLANDS = load_json(ISLANDS_FILE) or {"type":"FeatureCollection","features":[]}
-LAND = load_json(LAND_FILE) or {"type":"FeatureCollection","features":[]}
-ROCKS_RAW = load_json(ROCKS_FILE) or {"elements":[]}
-PORTS_RAW = load_json(PORTS_FILE) or {"elements":[]}
-
-ROCKS = [{"lat": e["lat"], "lon": e["lon"], "name": e.get("tags", {}).get("name","rock")}
-         for e in ROCKS_RAW.get("elements", []) if e.get("type")=="node" and "lat" in e]
-
-PORTS = []
-if isinstance(PORTS_RAW, dict):
-    if "elements" in PORTS_RAW:
-        for e in PORTS_RAW.get("elements", []):
-            if e.get("type") == "node":
-                PORTS.append({"lat": e["lat"], "lon": e["lon"], "name": e.get("tags", {}).get("name","port")})
-    elif PORTS_RAW.get("type") == "FeatureCollection":
-        for feat in PORTS_RAW.get("features", []):
-            geom = feat.get("geometry", {})
-            if geom.get("type") == "Point":
-                lon, lat = geom["coordinates"]
-                PORTS.append({"lat": lat, "lon": lon, "name": feat.get("properties", {}).get("name","port")})
-
-ALL_ISLAND_FEATURES = []
-if ISLANDS.get("type") == "FeatureCollection":
-    ALL_ISLAND_FEATURES += ISLANDS.get("features", [])
-if LAND.get("type") == "FeatureCollection":
-    ALL_ISLAND_FEATURES += LAND.get("features", [])
-
-OBSTACLES_UNION = unary_union([shape(f["geometry"]) for f in ALL_ISLAND_FEATURES if f.get("geometry")])
+# Columnar obstacle / rock / port tables (geodata.py), cached on disk between restarts
+GEODATA = load_or_ingest(GEODATA_FILE, [ISLANDS_FILE, LAND_FILE], ROCKS_FILE, PORTS_FILE)
+ROCKS = GEODATA.rocks
+PORTS = GEODATA.ports
+ISLAND_FEATURES = GEODATA.obstacles.features_json()    # pre-encoded GeoJSON for the map overlay
+
+OBSTACLES_UNION = GEODATA.obstacles.union()
+
+# Multi-resolution obstacle masks (0.4° .. 0.025°), cached on disk between restarts
+GRID_PYRAMID = load_or_build_pyramid(PYRAMID_FILE, [ISLANDS_FILE, LAND_FILE, ROCKS_FILE],
+                                     OBSTACLES_UNION, ROCKS, SEA_BOUNDS)
+
+# Quadtree navigation mesh over the finest pyramid level
+NAV_MESH = load_or_build_navmesh(NAVMESH_FILE, GRID_PYRAMID.levels[-1],
+                                 key=pyramid_cache_key([ISLANDS_FILE, LAND_FILE, ROCKS_FILE], SEA_BOUNDS))
+
+# Visibility graph over buffered, simplified coastlines (geometric shortest paths)
+VIS_GRAPH = load_or_build_visgraph(VISGRAPH_FILE, OBSTACLES_UNION, ROCKS, SEA_BOUNDS,
+                                   key=pyramid_cache_key([ISLANDS_FILE, LAND_FILE, ROCKS_FILE], SEA_BOUNDS))
+
+# Line-of-sight index used when simplifying returned routes
+CLEARANCE = ClearanceIndex(OBSTACLES_UNION, ROCKS, SEA_BOUNDS)
+
+# Landmark distance tables (ALT heuristic for the grid engine), memory-mapped from disk
+SEA_GRID = SeaGrid(SEA_BOUNDS, GRID_RES, R_MAX, C_MAX)
+LANDMARKS = load_or_build_landmarks(LANDMARKS_FILE, SEA_GRID, OBSTACLES_UNION, ROCKS, PORTS,
+                                    key=pyramid_cache_key([ISLANDS_FILE, LAND_FILE, ROCKS_FILE, PORTS_FILE],
+                                                          SEA_BOUNDS, (GRID_RES,)))
+GRID_SEARCHES = ("alt", "bidirectional", "haversine")
+
+# Frontend and /data files with precompressed variants and content-hashed URLs
+ASSETS = AssetStore(ASSETS_DIR)
+ASSETS.add_directory("/static", STATIC_DIR)
+ASSETS.add_directory("/templates", TEMPLATE_DIR)
+ASSETS.add_directory("/data", DATA_DIR, recursive=False)
+ASSETS.build()
 
 # ----------------------------
 # Mock AIS
@@ -215,8 +245,8 @@ def build_weight_grid(rmin, rmax, cmin, cmax, dynamic_ships=None, buffer_cells=1
             pt = Point(lon, lat)
             if OBSTACLES_UNION.contains(pt):
                 grid[r][c] = 1e9
-    for rock in ROCKS:
-        rr, cc = latlon_to_grid(rock["lat"], rock["lon"])
+    for lat, lon in zip(ROCKS.lat.tolist(), ROCKS.lon.tolist()):
+        rr, cc = latlon_to_grid(lat, lon)
         if rmin <= rr <= rmax and cmin <= cc <= cmax:
             grid[rr-rmin][cc-cmin] = 1e9
     if dynamic_ships:
@@ -233,7 +263,10 @@ def neighbors_sub(cell, Rn, Cn):
         if 0<=nr<Rn and 0<=nc<Cn:
             yield (nr,nc)
 
-def weighted_a_star_sub(start_latlon, end_latlon, grid, rmin, cmin, Rn, Cn):
+def weighted_a_star_sub(start_latlon, end_latlon, grid, rmin, cmin, Rn, Cn, stats=None, search="alt"):
+    """A* over a window of the weight grid. `search`: "alt" (landmark lower
+    bounds, the default), "bidirectional" (meet-in-the-middle with the same
+    bounds) or "haversine" (straight-line bound only)."""
     s_r, s_c = latlon_to_grid(*start_latlon)
     e_r, e_c = latlon_to_grid(*end_latlon)
     s, e = (s_r-rmin, s_c-cmin), (e_r-rmin, e_c-cmin)
@@ -242,32 +275,53 @@ def weighted_a_star_sub(start_latlon, end_latlon, grid, rmin, cmin, Rn, Cn):
     if grid[s[0]][s[1]]>=1e9: grid[s[0]][s[1]]=1.0
     if grid[e[0]][e[1]]>=1e9: grid[e[0]][e[1]]=1.0
 
+    # Landmark bounds hold only for endpoints that are open in the tables (ports)
+    alt = search != "haversine" and LANDMARKS.covers((s_r, s_c)) and LANDMARKS.covers((e_r, e_c))
+    if alt and not LANDMARKS.connected((s_r, s_c), (e_r, e_c)):
+        return None
+    h = LANDMARKS.bounds_to((e_r, e_c), rmin, cmin, Rn, Cn, alt=alt).tolist()
+    if search == "bidirectional" and alt:
+        h_s = LANDMARKS.bounds_to((s_r, s_c), rmin, cmin, Rn, Cn).tolist()
+        path = bidirectional_search(grid, s, e, rmin, Rn, Cn, h, h_s, SEA_GRID, stats)
+        return [grid_to_latlon(p[0]+rmin,p[1]+cmin) for p in path] if path else None
+
+    step_ns, step_ew = SEA_GRID.step_ns, SEA_GRID.step_ew
+    inf = float("inf")
     open_set = [(0.0, s)]
     g_score = {s:0.0}
     came_from = {}
+    expanded = pushes = 0
 
-    def heuristic(a,b):
-        lat1, lon1 = grid_to_latlon(a[0]+rmin,a[1]+cmin)
-        lat2, lon2 = grid_to_latlon(b[0]+rmin,b[1]+cmin)
-        return haversine_nm(lat1, lon1, lat2, lon2)
+    def record():
+        if stats is not None:
+            stats["nodes_expanded"] = stats.get("nodes_expanded", 0) + expanded
+            stats["heap_pushes"] = stats.get("heap_pushes", 0) + pushes
 
     while open_set:
         _, current = heapq.heappop(open_set)
+        expanded += 1
         if current==e:
+            record()
             path=[current]
             while current in came_from:
                 current=came_from[current]
                 path.append(current)
             path.reverse()
             return [grid_to_latlon(p[0]+rmin,p[1]+cmin) for p in path]
+        r = current[0]
         for neigh in neighbors_sub(current,Rn,Cn):
             w = grid[neigh[0]][neigh[1]]
             if w>=1e9: continue
-            tentative_g = g_score[current]+heuristic(current, neigh)*w
-            if tentative_g < g_score.get(neigh,float("inf")):
+            hn = h[neigh[0]][neigh[1]]
+            if hn == inf: continue       # cannot reach e (landmark tables)
+            step = step_ew[r+rmin] if neigh[0]==r else step_ns[min(r, neigh[0])+rmin]
+            tentative_g = g_score[current]+step*w
+            if tentative_g < g_score.get(neigh,inf):
                 came_from[neigh] = current
                 g_score[neigh] = tentative_g
-                heapq.heappush(open_set,(tentative_g+heuristic(neigh,e),neigh))
+                heapq.heappush(open_set,(tentative_g+hn,neigh))
+                pushes += 1
+    record()
     return None
 
 # ----------------------------
@@ -275,30 +329,128 @@ def weighted_a_star_sub(start_latlon, end_latlon, grid, rmin, cmin, Rn, Cn):
 # ----------------------------
 app = FastAPI(title="RouteUrSea - Integrated Backend")
 
+def asset_response(url, request_headers):
+    """Precompressed file response for a registered asset (304 when the client
+    has it), or None for unknown URLs."""
+    asset, immutable = ASSETS.lookup(url)
+    if asset is None:
+        return None
+    path, encoding = ASSETS.negotiate(asset, request_headers.get("accept-encoding"))
+    if ASSETS.not_modified(asset, request_headers.get("if-none-match")):
+        headers = ASSETS.headers(asset, immutable)
+        headers["ETag"] = asset.etag(encoding)
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=asset.media_type, headers=ASSETS.headers(asset, immutable, encoding))
+
+class AssetFiles:
+    """Mountable app serving ASSETS by plain or hashed URL; other files go to `fallback`."""
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        response = None
+        if scope["method"] in ("GET", "HEAD"):
+            response = asset_response(scope["path"], Request(scope).headers)
+        if response is None:
+            if self.fallback is not None:
+                return await self.fallback(scope, receive, send)
+            response = PlainTextResponse("Not Found", status_code=404)
+        await response(scope, receive, send)
+
 # Mount static
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+app.mount("/static", AssetFiles(StaticFiles(directory=STATIC_DIR)), name="static")
+app.mount("/data", AssetFiles(), name="data")
+
+# ----------------------------
+# Instrumentation: per-stage timings -> Server-Timing header and /metrics
+# ----------------------------
+METRICS = MetricsRegistry()
+PROFILES = ProfileStore(PROFILE_DIR)
+
+def profiled_route(scope):
+    """True when the request is routed to an @profiled endpoint."""
+    for route in app.router.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return is_profiled(getattr(route, "endpoint", None))
+    return False
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    # ?profile=1 only means something to @profiled endpoints; elsewhere it is ignored
+    allowed = profile_requested(request.query_params, request.headers)
+    if allowed is not None and not profiled_route(request.scope):
+        allowed = None
+    if allowed is False:
+        return JSONResponse({"detail": "Profiling not permitted"}, status_code=403)
+    m, token = begin_request()
+    m.profile_requested = bool(allowed)
+    try:
+        response = await call_next(request)
+    finally:
+        end_request(token)
+    total = time.perf_counter() - m.start
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    response.headers["Server-Timing"] = m.server_timing(total)
+    if m.profile is not None:
+        profile = build_profile(route, m.profile, m)
+        PROFILES.save(profile)
+        response.headers["X-Profile-Id"] = profile["id"]
+    response.body_iterator = record_when_sent(response.body_iterator, route, response.status_code, m)
+    return response
+
+async def record_when_sent(body, route, status, m):
+    """Relay the response body and record the request once it has all been sent,
+    so stages run inside streaming bodies and the bytes they produce are counted."""
+    size = 0
+    try:
+        async for chunk in body:
+            size += len(chunk)
+            yield chunk
+    finally:
+        if size:
+            m.add("payload_bytes", size)
+        METRICS.record(route, status, m, time.perf_counter() - m.start)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(METRICS.expose() + SCHEDULER.expose(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/profiles/{profile_id}")
+def get_profile(profile_id: str, request: Request, format: str = "json"):
+    """A stored request profile: json (everything), text (call tree) or collapsed (flamegraph input)."""
+    if not profile_requested({"profile": "1"}, request.headers):
+        raise HTTPException(status_code=403, detail="Profiling not permitted")
+    profile = PROFILES.load(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(profile["call_tree"])
+    if format == "collapsed":
+        return PlainTextResponse(profile["collapsed"])
+    return profile
 
 # ----------------------------
 # Web pages routing
 # ----------------------------
 @app.get("/")
-def serve_home():
-    return FileResponse(STATIC_DIR / "home.html")
+def serve_home(request: Request):
+    return asset_response("/static/home.html", request.headers) or FileResponse(STATIC_DIR / "home.html")
 
 @app.get("/emissions")
-def serve_emissions():
-    return FileResponse(STATIC_DIR / "emissions.html")
+def serve_emissions(request: Request):
+    return asset_response("/static/emissions.html", request.headers) or FileResponse(STATIC_DIR / "emissions.html")
 
 @app.get("/route")
-def serve_route_selection():
-    return FileResponse(TEMPLATE_DIR / "route_selection.html")
+def serve_route_selection(request: Request):
+    return (asset_response("/templates/route_selection.html", request.headers)
+            or FileResponse(TEMPLATE_DIR / "route_selection.html"))
 
 # ----------------------------
 # API - Ports
 # ----------------------------
 @app.get("/api/ports")
 def api_ports():
-    return JSONResponse(PORTS)
+    return JSONResponse(PORTS.records())
 
 # ----------------------------
 # API - Optimize Route
@@ -306,67 +458,261 @@ def api_ports():
 class RouteRequest(BaseModel):
     origin: str
     destination: str
+    engine: Optional[str] = "grid"
+    resolution: Optional[float] = None   # degrees; selects a pyramid level
+    exact: Optional[bool] = False        # True = every search waypoint, no simplification
+    format: Optional[str] = "points"     # points | flat | polyline
+    search: Optional[str] = "alt"        # grid engine: alt | bidirectional | haversine
+
+# Engines are generators: they yield (main path, resolution) as soon as the main
+# search finishes and only run the alternative search when asked for the next
+# item, which lets /api/optimize-route/stream send the main route first.
+def grid_routes(origin, dest, ships, bbox, req):
+    rmin, cmin = latlon_to_grid(bbox["lat_min"], bbox["lon_min"])
+    rmax, cmax = latlon_to_grid(bbox["lat_max"], bbox["lon_max"])
+
+    stats = search_stats()
+
+    with stage("rasterize"):
+        grid, Rn, Cn = build_weight_grid(rmin,rmax,cmin,cmax,dynamic_ships=ships)
+    stats["cells_rasterized"] = stats.get("cells_rasterized", 0) + Rn*Cn
+
+    with stage("search"):
+        path_main = weighted_a_star_sub((origin["lat"], origin["lon"]),
+                                        (dest["lat"], dest["lon"]),
+                                        grid, rmin, cmin, Rn, Cn, stats, req.search or "alt")
+    yield path_main, GRID_RES
+    if not path_main:
+        return
+
+    with stage("alternatives"):
+        alt_grid = [row[:] for row in grid]
+        for lat, lon in path_main[len(path_main)//3:2*len(path_main)//3]:
+            rr, cc = latlon_to_grid(lat, lon)
+            if rmin<=rr<=rmax and cmin<=cc<=cmax:
+                alt_grid[rr-rmin][cc-cmin] = max(alt_grid[rr-rmin][cc-cmin], 200.0)
+
+        path_alt = weighted_a_star_sub((origin["lat"], origin["lon"]),
+                                       (dest["lat"], dest["lon"]),
+                                       alt_grid, rmin, cmin, Rn, Cn, stats, req.search or "alt")
+    yield path_alt, GRID_RES
+
+def pyramid_routes(origin, dest, ships, bbox, req):
+    start, end = (origin["lat"], origin["lon"]), (dest["lat"], dest["lon"])
+    stats = search_stats()
+    with stage("search"):
+        cells, level = coarse_to_fine(GRID_PYRAMID, start, end, bbox, resolution=req.resolution, ships=ships, stats=stats)
+    yield (cells_to_latlon(level, cells) if cells else None), level.res
+    if not cells:
+        return
+    with stage("alternatives"):
+        alt_cells = alternative_cells(level, start, end, bbox, cells, ships=ships, stats=stats)
+    yield (cells_to_latlon(level, alt_cells) if alt_cells else None), level.res
+
+def quadtree_routes(origin, dest, ships, bbox, req):
+    routes = iter_navmesh_routes(NAV_MESH, (origin["lat"], origin["lon"]),
+                                 (dest["lat"], dest["lon"]), bbox, ships=ships, stats=search_stats())
+    with stage("search"):
+        path_main = next(routes)
+    yield path_main, NAV_MESH.res
+    with stage("alternatives"):
+        path_alt = next(routes, None)
+    yield path_alt, NAV_MESH.res
+
+def visgraph_engine_routes(origin, dest, ships, bbox, req):
+    # Geometric shortest paths: dynamic ship traffic is not weighted here.
+    routes = iter_visgraph_routes(VIS_GRAPH, (origin["lat"], origin["lon"]), (dest["lat"], dest["lon"]),
+                                  stats=search_stats())
+    with stage("search"):
+        path_main = next(routes)
+    yield path_main, None
+    with stage("alternatives"):
+        path_alt = next(routes, None)
+    yield path_alt, None
+
+ROUTING_ENGINES = {"grid": grid_routes, "pyramid": pyramid_routes, "quadtree": quadtree_routes,
+                   "visgraph": visgraph_engine_routes}
 
-@app.post("/api/optimize-route")
-def api_optimize(req: RouteRequest):
-    origin = next((p for p in PORTS if req.origin.lower() in p["name"].lower()), None)
-    dest = next((p for p in PORTS if req.destination.lower() in p["name"].lower()), None)
+# ----------------------------
+# Admission control: routing and batch work queue per class (see scheduler.py);
+# everything else is served without waiting behind it.
+# ----------------------------
+SCHEDULER = Scheduler()
+
+@asynccontextmanager
+async def scheduled(cls_name, cost):
+    with stage("queue"):
+        try:
+            await SCHEDULER.acquire(cls_name, cost)
+        except Overloaded as e:
+            raise HTTPException(status_code=503, detail=f"Server busy ({e.reason}), retry later",
+                                headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield
+    finally:
+        SCHEDULER.release(cls_name)
+
+def route_cost(payload):
+    """Estimated cost of a route request body; unknown ports are cheap (they fail fast)."""
+    if not isinstance(payload, dict):
+        return 0.0
+    origin = PORTS.find(str(payload.get("origin", "")))
+    dest = PORTS.find(str(payload.get("destination", "")))
+    if not origin or not dest:
+        return 0.0
+    resolution = payload.get("resolution")
+    engine = payload.get("engine") or "grid"
+    if engine == "grid" and resolution is not None:
+        engine = "pyramid"          # as in route_context
+    if engine == "pyramid" and isinstance(resolution, (int, float)) and resolution > 0:
+        resolution = GRID_PYRAMID.level(resolution).res     # the level that will be searched
+    else:
+        resolution = GRID_RES       # the other engines search at GRID_RES
+    bbox = {"lat_min": min(origin["lat"], dest["lat"])-3, "lat_max": max(origin["lat"], dest["lat"])+3,
+            "lon_min": min(origin["lon"], dest["lon"])-3, "lon_max": max(origin["lon"], dest["lon"])+3}
+    return estimate_route_cost(engine, bbox, haversine_nm(origin["lat"], origin["lon"], dest["lat"], dest["lon"]),
+                               resolution)
+
+async def admit_route(request: Request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    cost = route_cost(payload)
+    async with scheduled(route_class(cost), cost):
+        yield
+
+async def admit_batch(request: Request):
+    cost = int(request.headers.get("content-length") or 0) / 100.0   # ~100 bytes per voyage, ~1 ms per 1k
+    async with scheduled("batch", cost):
+        yield
+
+def route_context(req):
+    """Resolve ports, engine, output format, ship traffic and search window."""
+    origin = PORTS.find(req.origin)
+    dest = PORTS.find(req.destination)
     if not origin or not dest:
         raise HTTPException(status_code=400, detail="Port not found")
 
-    ships = get_ships_near_area(**SEA_BOUNDS)
-
-    lat_min = min(origin["lat"], dest["lat"])-3
-    lat_max = max(origin["lat"], dest["lat"])+3
-    lon_min = min(origin["lon"], dest["lon"])-3
-    lon_max = max(origin["lon"], dest["lon"])+3
-    rmin, cmin = latlon_to_grid(lat_min, lon_min)
-    rmax, cmax = latlon_to_grid(lat_max, lon_max)
+    engine = req.engine or "grid"
+    if engine == "grid" and req.resolution is not None:
+        engine = "pyramid"
+    if engine not in ROUTING_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown engine '{engine}'")
+    fmt = req.format or "points"
+    if fmt not in ROUTE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{fmt}'")
+    if (req.search or "alt") not in GRID_SEARCHES:
+        raise HTTPException(status_code=400, detail=f"Unknown search '{req.search}'")
 
-    grid, Rn, Cn = build_weight_grid(rmin,rmax,cmin,cmax,dynamic_ships=ships)
+    ships = get_ships_near_area(**SEA_BOUNDS)
 
-    path_main = weighted_a_star_sub((origin["lat"], origin["lon"]),
-                                    (dest["lat"], dest["lon"]),
-                                    grid, rmin, cmin, Rn, Cn)
+    bbox = {"lat_min": min(origin["lat"], dest["lat"])-3,
+            "lat_max": max(origin["lat"], dest["lat"])+3,
+            "lon_min": min(origin["lon"], dest["lon"])-3,
+            "lon_max": max(origin["lon"], dest["lon"])+3}
+    return {"origin": origin, "destination": dest, "ships": ships, "engine": engine, "format": fmt, "bbox": bbox}
+
+def iter_route_paths(ctx, req):
+    """Yield (path, resolution) for the main route, then the alternative,
+    simplified unless req.exact. Raises 500 when there is no main route."""
+    routes = ROUTING_ENGINES[ctx["engine"]](ctx["origin"], ctx["destination"], ctx["ships"], ctx["bbox"], req)
+    path_main, resolution = next(routes)
     if not path_main:
         raise HTTPException(status_code=500, detail="No feasible route")
-
-    alt_grid = [row[:] for row in grid]
-    for lat, lon in path_main[len(path_main)//3:2*len(path_main)//3]:
-        rr, cc = latlon_to_grid(lat, lon)
-        if rmin<=rr<=rmax and cmin<=cc<=cmax:
-            alt_grid[rr-rmin][cc-cmin] = max(alt_grid[rr-rmin][cc-cmin], 200.0)
-
-    path_alt = weighted_a_star_sub((origin["lat"], origin["lon"]),
-                                   (dest["lat"], dest["lon"]),
-                                   alt_grid, rmin, cmin, Rn, Cn)
-
-    rocks_features = [{"type":"Feature","properties":{"name":r["name"]},
-                       "geometry":{"type":"Point","coordinates":[r["lon"],r["lat"]]}} for r in ROCKS]
-
-    ships_features = [{"type":"Feature","properties":{"name":s["name"]},
-                       "geometry":{"type":"Point","coordinates":[s["lon"],s["lat"]]}} for s in ships]
+    for path, resolution in itertools.chain([(path_main, resolution)], routes):
+        if path and not req.exact:
+            with stage("simplify"):
+                path = simplify_path(path, CLEARANCE)
+        yield path, resolution
+
+def plan_route(req):
+    """Resolve ports, run the selected engine and post-process the paths.
+    Shared by /api/optimize-route and /api/route-emissions."""
+    ctx = route_context(req)
+    paths = iter_route_paths(ctx, req)
+    path_main, resolution = next(paths)
+    path_alt, _ = next(paths, (None, resolution))
+    return {**ctx, "resolution": resolution, "main": path_main, "alt": path_alt}
+
+def point_features(points):
+    return [{"type":"Feature","properties":{"name":p["name"]},
+             "geometry":{"type":"Point","coordinates":[p["lon"],p["lat"]]}} for p in points]
+
+class RawJSONResponse(JSONResponse):
+    """JSONResponse that splices pre-encoded overlays (geodata.RawJSON) into the body."""
+    def render(self, content):
+        return dumps(content)
+
+def optimize_route_body(route):
+    with stage("overlays"):
+        rocks_features = ROCKS.features_json()
+        ships_features = point_features(route["ships"])
+        zones = COMPLIANCE.zones_along(route["main"])
 
     return {
-        "main_route":[{"lat": round(p[0],6), "lon": round(p[1],6)} for p in path_main],
-        "alt_route":[{"lat": round(p[0],6), "lon": round(p[1],6)} for p in path_alt] if path_alt else [],
+        "engine": route["engine"],
+        "resolution": route["resolution"],
+        "format": route["format"],
+        "main_route": encode_route(route["main"], route["format"]),
+        "alt_route": encode_route(route["alt"], route["format"]),
+        "zones": zones,
         "obstacles":{
-            "islands": ALL_ISLAND_FEATURES,
+            "islands": ISLAND_FEATURES,
             "rocks": rocks_features,
             "ships": ships_features
         }
     }
 
+@app.post("/api/optimize-route", dependencies=[Depends(admit_route)])
+@profiled
+def api_optimize(req: RouteRequest):
+    body = optimize_route_body(plan_route(req))
+    with stage("serialize"):
+        return RawJSONResponse(body)
+
+def ndjson_line(obj):
+    return dumps(obj) + b"\n"
+
+@app.post("/api/optimize-route/stream", dependencies=[Depends(admit_route)])
+def api_optimize_stream(req: RouteRequest):
+    """Same result as /api/optimize-route as NDJSON events, each sent as soon as it is ready:
+    the main route (with zones), the alternative, then the ship, rock and island overlays,
+    then a final "done" event. Errors before the main route is found are plain HTTP errors;
+    the response starts only once there is a main route to send."""
+    t0 = time.perf_counter()
+    ctx = route_context(req)
+    paths = iter_route_paths(ctx, req)
+    path_main, resolution = next(paths)
+    elapsed = lambda: round((time.perf_counter() - t0) * 1000, 2)
+
+    def events():
+        yield ndjson_line({"event": "route", "kind": "main", "engine": ctx["engine"], "resolution": resolution,
+                           "format": ctx["format"], "route": encode_route(path_main, ctx["format"]),
+                           "zones": COMPLIANCE.zones_along(path_main), "elapsed_ms": elapsed()})
+        path_alt, _ = next(paths, (None, resolution))
+        yield ndjson_line({"event": "route", "kind": "alt", "route": encode_route(path_alt, ctx["format"]),
+                           "elapsed_ms": elapsed()})
+        # Cheapest overlays first; the island features are ~2 MB of JSON.
+        for layer, features in (("ships", point_features(ctx["ships"])), ("rocks", ROCKS.features_json()),
+                                ("islands", ISLAND_FEATURES)):
+            yield ndjson_line({"event": "overlay", "layer": layer, "features": features, "elapsed_ms": elapsed()})
+        yield ndjson_line({"event": "done", "elapsed_ms": elapsed()})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 # ----------------------------
 # API - Weather
 # ----------------------------
 @app.get("/weather")
+@profiled
 def get_weather(lat: float, lon: float):
     forecast_url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&hourly=temperature_2m,windspeed_10m,weathercode,visibility,precipitation,cloudcover&timezone=auto"
     marine_url = f"https://marine-api.open-meteo.com/v1/marine?latitude={lat}&longitude={lon}&hourly=wave_height,wave_direction,wave_period&timezone=auto"
 
-    forecast_res = requests.get(forecast_url).json()
-    marine_res = requests.get(marine_url).json()
+    with stage("upstream"):
+        forecast_res = requests.get(forecast_url).json()
+        marine_res = requests.get(marine_url).json()
 
     merged_data = []
     if "hourly" in forecast_res and "hourly" in marine_res:
@@ -419,29 +765,14 @@ def get_badge(improvement_pct):
     else:
         return "🚢 Standard Mode"
 
-def check_marpol_limits(vessel_type: str, fuel_type: str, co2_kg: float, speed_knots: float):
-    compliance = {}
-    if (vessel_type=="small_coastal" and co2_kg>2500) or \
-       (vessel_type=="medium_cargo" and co2_kg>6000) or \
-       (vessel_type=="large_container" and co2_kg>20000):
-        compliance["annex_vi_Air_Pollution"]={"message":"❌ Exceeds emission threshold (Annex VI)","passed":False}
-    else:
-        compliance["annex_vi_Air_Pollution"]={"message":"✅ Within emission limits (Annex VI)","passed":True}
-
-    if vessel_type=="small_coastal" and fuel_type=="HFO":
-        compliance["annex_i"]={"message":"⚠️ HFO restricted for small coastal vessels (Annex I)","passed":False}
-    else:
-        compliance["annex_i"]={"message":"✅ Fuel use compliant (Annex I)","passed":True}
+# MARPOL rule tables and ECA / restricted-zone geofences
+COMPLIANCE = ComplianceEngine.from_files(COMPLIANCE_RULES_FILE, GEOFENCES_FILE)
 
-    if (vessel_type=="small_coastal" and speed_knots>9) or \
-       (vessel_type=="medium_cargo" and speed_knots>12) or \
-       (vessel_type=="large_container" and speed_knots>18):
-        compliance["annex_vi_eco_speed"]={"message":"⚠️ Above eco-speed, may increase emissions (Annex VI)","passed":False}
-    else:
-        compliance["annex_vi_eco_speed"]={"message":"✅ Speed within eco-recommendations (Annex VI)","passed":True}
-    return compliance
+def check_marpol_limits(vessel_type: str, fuel_type: str, co2_kg: float, speed_knots: float):
+    return COMPLIANCE.check(vessel_type, fuel_type, co2_kg, speed_knots)
 
 @app.post("/api/calculate")
+@profiled
 def calculate(req: CalcRequest):
     vt = req.vessel_type if req.vessel_type in BASE_RATES else "medium_cargo"
     params = BASE_RATES[vt]
@@ -470,3 +801,123 @@ def calculate(req: CalcRequest):
             "baseline_co2_kg":round(baseline_co2,2),"eco_improvement_pct":eco_improvement,
             "eco_rating_badge":badge,"scenarios":scenarios}
 
+
+# ----------------------------
+# API - Batch emissions (vectorized, NDJSON out)
+# ----------------------------
+FLEET_TABLES = FleetTables(BASE_RATES, EMISSION_FACTORS, ECO_BADGES, COMPLIANCE)
+
+@app.post("/api/calculate/batch", dependencies=[Depends(admit_batch)])
+async def calculate_batch(request: Request, compact: bool = False):
+    """Voyages as NDJSON, a JSON list, {"voyages": [...]} or column arrays;
+    results stream back as NDJSON in input order."""
+    body = await request.body()
+    try:
+        cols = parse_batch(body, request.headers.get("content-type", ""))
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {e}")
+    return StreamingResponse(stream_ndjson(cols, FLEET_TABLES, compact), media_type="application/x-ndjson")
+
+
+# ----------------------------
+# API - Speed plan (min CO2 under an ETA deadline)
+# ----------------------------
+class SpeedSegment(BaseModel):
+    distance_nm: float
+    weather_resistance: Optional[float] = 1.0
+
+class SpeedPlanRequest(BaseModel):
+    vessel_type: str
+    fuel_type: str
+    deadline_hours: float
+    distance_nm: Optional[float] = None
+    weather_resistance: Optional[float] = 1.0
+    segments: Optional[List[SpeedSegment]] = None
+
+SPEED_CURVES = SpeedCurves(FLEET_TABLES)
+
+@app.post("/api/optimize-speed")
+def optimize_speed(req: SpeedPlanRequest):
+    if req.segments:
+        distances = [s.distance_nm for s in req.segments]
+        resistances = [s.weather_resistance or 1.0 for s in req.segments]
+    elif req.distance_nm is not None:
+        distances, resistances = [req.distance_nm], [req.weather_resistance or 1.0]
+    else:
+        raise HTTPException(status_code=400, detail="Provide distance_nm or segments")
+    if req.deadline_hours <= 0 or min(distances) < 0:
+        raise HTTPException(status_code=400, detail="deadline_hours must be positive and distances non-negative")
+
+    vt = req.vessel_type if req.vessel_type in BASE_RATES else "medium_cargo"
+    plan = optimize_speed_plan(SPEED_CURVES, vt, req.fuel_type, distances, req.deadline_hours, resistances)
+    return {"vessel_type": vt, "fuel_type": req.fuel_type, **plan}
+
+
+# ----------------------------
+# API - Route + emissions pipeline
+# ----------------------------
+WEATHER_CACHE = WeatherCache()
+
+class VoyageRequest(RouteRequest):
+    vessel_type: str
+    speed_knots: float
+    fuel_type: str
+    use_weather: Optional[bool] = True
+
+def route_emissions(req, route):
+    """Fuel / CO2 / ETA per segment of a planned route with cached sea state.
+    Shared by /api/route-emissions and the batch CLI (batch.py)."""
+    seg_nm, mid_lat, mid_lon = route_segments(route["main"])
+    with stage("weather"):
+        if req.use_weather:
+            waves = WEATHER_CACHE.wave_heights(mid_lat.tolist(), mid_lon.tolist())
+        else:
+            waves = np.full(len(seg_nm), np.nan)
+        resistance = wave_resistance(waves)
+
+    vt = req.vessel_type if req.vessel_type in BASE_RATES else "medium_cargo"
+    with stage("emissions"):
+        labels, speeds, fuel, co2, hours = segment_emissions(FLEET_TABLES, vt, req.fuel_type, req.speed_knots,
+                                                             seg_nm, resistance)
+    fuel_tot, co2_tot, hours_tot = fuel.sum(axis=0), co2.sum(axis=0), hours.sum(axis=0)
+
+    scenarios = {}
+    for i, label in enumerate(labels):
+        scenarios[label] = {
+            "speed_knots": round(float(speeds[i]), 2),
+            "fuel_liters": round(float(fuel_tot[i]), 2),
+            "co2_kg": round(float(co2_tot[i]), 2),
+            "eta_hours": round(float(hours_tot[i]), 2),
+            "segment_co2_kg": np.round(co2[:, i], 2).tolist(),
+            "segment_arrival_hours": np.round(np.cumsum(hours[:, i]), 2).tolist(),
+            "marpol_compliance": check_marpol_limits(vessel_type=vt, fuel_type=req.fuel_type,
+                                                     co2_kg=float(co2_tot[i]), speed_knots=float(speeds[i])),
+        }
+
+    body = {
+        "engine": route["engine"],
+        "resolution": route["resolution"],
+        "format": route["format"],
+        "main_route": encode_route(route["main"], route["format"]),
+        "vessel_type": vt,
+        "fuel_type": req.fuel_type,
+        "requested_speed": max(req.speed_knots, 1.0),
+        "distance_nm": round(float(seg_nm.sum()), 2),
+        "segments": {
+            "distance_nm": np.round(seg_nm, 2).tolist(),
+            "midpoint_lat": np.round(mid_lat, 4).tolist(),
+            "midpoint_lon": np.round(mid_lon, 4).tolist(),
+            "wave_height_m": [None if np.isnan(h) else round(float(h), 2) for h in waves],
+            "weather_resistance": np.round(resistance, 3).tolist(),
+        },
+        "zones": COMPLIANCE.zones_along(route["main"], req.fuel_type),
+        "scenarios": scenarios,
+    }
+    return body
+
+@app.post("/api/route-emissions", dependencies=[Depends(admit_route)])
+def api_route_emissions(req: VoyageRequest):
+    """Route, then fuel / CO2 / ETA per segment with cached sea state, in one request."""
+    body = route_emissions(req, plan_route(req))
+    with stage("serialize"):
+        return JSONResponse(body)
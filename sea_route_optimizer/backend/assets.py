@@ -0,0 +1,198 @@
+# backend/assets.py
+# Precompressed, content-hashed static assets (frontend files and /data).
+#
+# At startup every registered file is hashed and, for text types, compressed
+# to gzip (and brotli when the optional `brotli` package is installed) into
+# data/cache/assets/, once per content hash. Each asset is then served under
+# its plain URL (/static/js/main.js) and a content-hashed one
+# (/static/js/main.3f2a9c1d0b7e.js):
+#   - hashed URLs never change content: Cache-Control public, one year, immutable
+#   - plain URLs: no-cache, so browsers revalidate with the ETag (the content
+#     hash) and get a 304 instead of the body
+# References between assets (pages -> scripts / styles, main.js -> /data/*.geojson)
+# are rewritten to the hashed URLs, so a repeat visit costs one revalidation
+# of the page and no other request.
+#
+# A response always names a file on disk (the original, a rewritten copy or a
+# compressed variant), never bytes in memory: Starlette's FileResponse hands it
+# to the server with http.response.pathsend where supported, Flask's send_file
+# goes through wsgi.file_wrapper (sendfile under gunicorn).
+import gzip, hashlib, logging, mimetypes, os, re, time
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {".html", ".css", ".js", ".json", ".geojson", ".svg", ".txt", ".map"}
+REWRITE = (".css", ".js", ".html")     # rewritten in this order, after everything else
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+HASH_CHARS = 12
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+mimetypes.add_type("application/geo+json", ".geojson")
+mimetypes.add_type("text/javascript", ".js")
+
+
+class Asset:
+    __slots__ = ("url", "hashed_url", "path", "media_type", "digest", "size", "variants")
+
+    def __init__(self, url, hashed_url, path, media_type, digest, size):
+        self.url, self.hashed_url, self.path = url, hashed_url, path
+        self.media_type, self.digest, self.size = media_type, digest, size
+        self.variants = {}     # encoding -> (path, size), smaller than the original only
+
+    def etag(self, encoding=None):
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+def hashed_name(url, digest):
+    stem, dot, suffix = url.rpartition(".")
+    if not dot or "/" in suffix:
+        return f"{url}.{digest}"
+    return f"{stem}.{digest}.{suffix}"
+
+
+def parse_accept_encoding(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            name, _, value = p.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class AssetStore:
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.sources = []          # (url prefix, directory, recursive)
+        self.assets = {}           # plain url -> Asset
+        self.by_url = {}           # plain and hashed url -> (Asset, immutable)
+        self.linkable = {}         # plain url -> hashed url, for rewriting (pages keep their URLs)
+        self._pattern = None
+
+    def add_directory(self, prefix, directory, recursive=True):
+        self.sources.append((prefix.rstrip("/"), Path(directory), recursive))
+
+    def build(self):
+        t = time.perf_counter()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        for prefix, directory, recursive in self.sources:
+            if not directory.is_dir():
+                continue
+            paths = directory.rglob("*") if recursive else directory.iterdir()
+            files += [(f"{prefix}/{p.relative_to(directory).as_posix()}", p) for p in paths if p.is_file()]
+        def order(item):      # files that reference others come after them
+            suffix = item[1].suffix.lower()
+            return REWRITE.index(suffix) + 1 if suffix in REWRITE else 0
+        for url, path in sorted(files, key=order):
+            self._add(url, path)
+        raw = sum(a.size for a in self.assets.values())
+        packed = sum(min([a.size] + [s for _, s in a.variants.values()]) for a in self.assets.values())
+        logging.info("Assets: %d files, %.1f MB -> %.1f MB precompressed (%s) in %.2fs", len(self.assets),
+                     raw / 1e6, packed / 1e6, "br+gzip" if brotli else "gzip", time.perf_counter() - t)
+        return self
+
+    def _add(self, url, path):
+        data = path.read_bytes()
+        suffix = path.suffix.lower()
+        if suffix in REWRITE:
+            data = self.rewrite(data)
+        digest = hashlib.sha256(data).hexdigest()[:HASH_CHARS]
+        if suffix in REWRITE:
+            path = self._cached(f"{digest}{suffix}", lambda: data)
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        asset = Asset(url, hashed_name(url, digest), path, media_type, digest, len(data))
+        if suffix in COMPRESSIBLE and len(data) >= MIN_COMPRESS_BYTES:
+            encoders = [("gzip", ".gz", lambda: gzip.compress(data, GZIP_LEVEL, mtime=0))]
+            if brotli is not None:
+                encoders.insert(0, ("br", ".br", lambda: brotli.compress(data, quality=BROTLI_QUALITY)))
+            for encoding, ext, encode in encoders:
+                variant = self._cached(f"{digest}{suffix}{ext}", encode)
+                size = variant.stat().st_size
+                if size < len(data):
+                    asset.variants[encoding] = (variant, size)
+        self.assets[url] = asset
+        self.by_url[url] = (asset, False)
+        self.by_url[asset.hashed_url] = (asset, True)
+        if suffix != ".html":
+            self.linkable[url] = asset.hashed_url
+            self._pattern = None
+        return asset
+
+    def _cached(self, name, produce):
+        """Content-addressed file in the cache dir, written once (atomically)."""
+        target = self.cache_dir / name
+        if not target.exists():
+            tmp = target.with_name(f".{name}.tmp")
+            tmp.write_bytes(produce())
+            os.replace(tmp, target)
+        return target
+
+    def rewrite(self, data):
+        """Replace references to already-built assets with their hashed URLs."""
+        if not self.linkable:
+            return data
+        if self._pattern is None:
+            urls = sorted(self.linkable, key=len, reverse=True)
+            self._pattern = re.compile("(" + "|".join(map(re.escape, urls)) + r")(?![\w.-])")
+        text = data.decode("utf-8")
+        return self._pattern.sub(lambda m: self.linkable[m.group(1)], text).encode("utf-8")
+
+    def url(self, url):
+        """Hashed URL for a plain asset URL (unchanged when unknown)."""
+        asset = self.assets.get(url)
+        return asset.hashed_url if asset else url
+
+    def lookup(self, url):
+        """(Asset, immutable) or (None, False)."""
+        return self.by_url.get(url, (None, False))
+
+    # ---------- HTTP ----------
+    def negotiate(self, asset, accept_encoding):
+        """(file path, content coding or None) for an Accept-Encoding header."""
+        if asset.variants:
+            accepted = parse_accept_encoding(accept_encoding)
+            wildcard = accepted.get("*", 0.0)
+            for encoding in ("br", "gzip"):
+                if encoding in asset.variants and accepted.get(encoding, wildcard) > 0:
+                    return asset.variants[encoding][0], encoding
+        return asset.path, None
+
+    def not_modified(self, asset, if_none_match):
+        """True when an If-None-Match header matches any representation of the asset."""
+        if not if_none_match:
+            return False
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or any(t.strip('"').split("-")[0] == asset.digest for t in tags)
+
+    def headers(self, asset, immutable, encoding=None):
+        headers = {"Cache-Control": IMMUTABLE if immutable else REVALIDATE, "ETag": asset.etag(encoding)}
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return headers
+
+
+if __name__ == "__main__":
+    # Build / refresh the precompressed assets ahead of deployment
+    from app1 import ASSETS
+    for a in sorted(ASSETS.assets.values(), key=lambda a: a.url):
+        sizes = " ".join(f"{enc}={size}" for enc, (_, size) in a.variants.items())
+        print(f"{a.hashed_url:<60} {a.size:>9} {sizes}")
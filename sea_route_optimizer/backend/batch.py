@@ -0,0 +1,381 @@
+# backend/batch.py
+# Offline route matrices and emissions reports, without the HTTP server.
+#
+#   python batch.py routes pairs.csv --out routes.ndjson --engine pyramid
+#   python batch.py routes voyages.ndjson --out report/ --format parquet
+#   python batch.py matrix ports.csv --out matrix.ndjson --symmetric
+#   python batch.py voyages fleet.csv --out fleet.ndjson
+#
+# Input is CSV or NDJSON (`-` reads NDJSON from stdin).
+#   routes:  origin, destination and optionally engine, resolution, vessel_type,
+#            speed_knots, fuel_type, use_weather. A row with vessel, speed and
+#            fuel (from the row or the --vessel-type / --speed / --fuel-type
+#            defaults) also gets the /api/route-emissions scenarios.
+#   matrix:  a `port` (or `name`) column; every ordered pair is routed, or every
+#            unordered pair with --symmetric.
+#   Route rows skip the alternative route unless --alternatives is given.
+#   voyages: /api/calculate rows (vessel_type, speed_knots, distance_nm,
+#            fuel_type, weather_resistance), evaluated with the batch kernels.
+#
+# Rows run in a process pool over all cores. The backend modules (app1) are
+# imported once in the parent, so forked workers share the loaded obstacle
+# data, pyramid, mesh and visibility graph instead of loading their own.
+# Results are written as they complete, one flat record per row with its input
+# `row` number: NDJSON lines, or columnar part files (Parquet with pyarrow,
+# otherwise NumPy .npz) in an output directory. Every --checkpoint records
+# are flushed to disk; re-running the same command skips the rows already in
+# the output, so an interrupted job resumes where it stopped. A manifest next
+# to the output records the input hash and settings, and a resume against a
+# different input or settings is refused (use --restart to start over).
+import argparse, csv, hashlib, io, json, logging, multiprocessing, os, re, sys, time
+from pathlib import Path
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:       # only needed for --format parquet
+    pa = pq = None
+
+VOYAGE_FIELDS = ("vessel_type", "speed_knots", "fuel_type")
+ROUTE_CHUNK = 2            # route rows per task: routes are slow, keep the pool balanced
+VOYAGE_CHUNK = 10000       # voyage rows per task (the kernels are vectorized)
+CHECKPOINT_ROWS = 200
+FORMATS = ("ndjson", "parquet", "npz")
+
+
+# ---------- Input ----------
+def read_rows(path):
+    """(rows, sha1 of the input bytes). CSV cells that are empty are dropped so
+    that defaults apply."""
+    data = sys.stdin.buffer.read() if str(path) == "-" else Path(path).read_bytes()
+    digest = hashlib.sha1(data).hexdigest()
+    if str(path).lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+        rows = [{k: v for k, v in r.items() if k and v not in (None, "")} for r in reader]
+    else:
+        rows = [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+    return rows, digest
+
+
+def matrix_pairs(rows, symmetric=False):
+    names = [r.get("port") or r.get("name") for r in rows]
+    if not all(names):
+        raise ValueError("every matrix row needs a `port` (or `name`) column")
+    return [{"origin": a, "destination": b} for i, a in enumerate(names) for j, b in enumerate(names)
+            if (i < j if symmetric else i != j)]
+
+
+# ---------- Workers ----------
+_settings = None
+
+
+def _init_worker(settings):
+    global _settings
+    _settings = settings
+    logging.getLogger().setLevel(logging.ERROR)
+
+
+def _app():
+    import app1     # already loaded in the parent when the pool forks
+    return app1
+
+
+def path_nm(path):
+    from voyage_pipeline import route_segments
+    return round(float(route_segments(path)[0].sum()), 2) if path and len(path) > 1 else 0.0
+
+
+def row_error(e):
+    """One-line error text for a failed row."""
+    from fastapi import HTTPException
+    from pydantic import ValidationError
+    if isinstance(e, HTTPException):
+        return str(e.detail)
+    text = str(e) if isinstance(e, ValidationError) else f"{type(e).__name__}: {e}"
+    return " ".join(text.split())
+
+
+def route_record(row_id, row, settings):
+    """One flat record: the route summary and, for voyage rows, per-scenario totals.
+    Any failure is reported in the record's `error` field instead of stopping the job."""
+    fields = {k: v for k, v in {**settings["defaults"], **row}.items() if v is not None}
+    rec = {"row": row_id, "origin": fields.get("origin"), "destination": fields.get("destination"), "error": None}
+    try:
+        return fill_route_record(dict(rec), fields, settings)
+    except Exception as e:
+        rec["error"] = row_error(e)
+        return rec
+
+
+def fill_route_record(rec, fields, settings):
+    app1 = _app()
+    voyage = all(k in fields for k in VOYAGE_FIELDS)
+    model = app1.VoyageRequest if voyage else app1.RouteRequest
+    req = model(**{k: v for k, v in fields.items() if k in model.model_fields})
+    # plan_route without the alternative search unless asked for: half the work for a matrix
+    ctx = app1.route_context(req)
+    paths = app1.iter_route_paths(ctx, req)
+    path_main, resolution = next(paths)
+    path_alt = next(paths, (None, None))[0] if settings["alternatives"] else None
+    route = {**ctx, "resolution": resolution, "main": path_main, "alt": path_alt}
+
+    rec.update({"origin_port": route["origin"]["name"], "destination_port": route["destination"]["name"],
+                "engine": route["engine"], "resolution": route["resolution"], "waypoints": len(route["main"]),
+                "distance_nm": path_nm(route["main"]),
+                "alt_distance_nm": path_nm(path_alt) if path_alt else None})
+    if voyage:
+        body = app1.route_emissions(req, route)
+        rec.update({"vessel_type": body["vessel_type"], "fuel_type": body["fuel_type"],
+                    "requested_speed": body["requested_speed"]})
+        for label, s in body["scenarios"].items():
+            rec[f"{label}_speed_knots"] = s["speed_knots"]
+            rec[f"{label}_fuel_liters"] = s["fuel_liters"]
+            rec[f"{label}_co2_kg"] = s["co2_kg"]
+            rec[f"{label}_eta_hours"] = s["eta_hours"]
+            rec[f"{label}_compliant"] = all(c["passed"] for c in s["marpol_compliance"].values())
+        rec["zones"] = list(dict.fromkeys(z["zone"] for z in body["zones"]))
+        rec["zones_compliant"] = all(z["passed"] is not False for z in body["zones"])
+    if settings["geometry"]:
+        rec["geometry"] = app1.encode_route(route["main"], "polyline")
+    return rec
+
+
+def route_task(items):
+    return [route_record(row_id, row, _settings) for row_id, row in items]
+
+
+def voyage_task(items):
+    """Evaluate a chunk of voyages at once; when the chunk fails, evaluate its
+    rows one by one so only the bad rows carry an `error`."""
+    from fleet_emissions import voyages_to_columns, evaluate, iter_records
+    app1 = _app()
+    try:
+        ids = [row_id for row_id, _ in items]
+        cols = voyages_to_columns([{**_settings["defaults"], **row} for _, row in items])
+        result = evaluate(cols, app1.FLEET_TABLES)
+        return [{"row": row_id, **rec, "error": None}
+                for row_id, rec in zip(ids, iter_records(cols, result, app1.FLEET_TABLES, True))]
+    except Exception as e:
+        if len(items) > 1:
+            return [rec for item in items for rec in voyage_task([item])]
+        # The columns hold this row alone: drop their "row 0:" so the error
+        # does not point at the wrong input row (the record has the real `row`)
+        return [{"row": items[0][0], "error": re.sub(r"\b(?:row|voyage) 0: ", "", row_error(e), count=1)}]
+
+
+# ---------- Output ----------
+def flatten(rec):
+    """Nested values (zone lists, ...) become JSON strings in columnar output."""
+    return {k: json.dumps(v, ensure_ascii=False) if isinstance(v, (list, dict)) else v for k, v in rec.items()}
+
+
+def to_arrays(records):
+    """Records -> dict of NumPy columns: bool, int64, float64 (NaN for missing)
+    or str ("" for missing)."""
+    keys = dict.fromkeys(k for r in records for k in r)
+    cols = {}
+    for k in keys:
+        values = [r.get(k) for r in records]
+        present = [v for v in values if v is not None]
+        complete = bool(present) and len(present) == len(values)
+        numeric = bool(present) and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present)
+        if complete and all(isinstance(v, bool) for v in present):
+            cols[k] = np.array(values, dtype=bool)
+        elif complete and numeric and all(isinstance(v, int) for v in present):
+            cols[k] = np.array(values, dtype=np.int64)
+        elif numeric:
+            cols[k] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        else:
+            cols[k] = np.array(["" if v is None else str(v) for v in values], dtype=str)
+    return cols
+
+
+class NDJSONSink:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.manifest = self.path.with_name(self.path.name + ".manifest.json")
+
+    def completed(self):
+        """Row ids already in the file; a torn last line from a crash is cut off."""
+        if not self.path.exists():
+            return set()
+        data = self.path.read_bytes()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        return {json.loads(line)["row"] for line in data[:end].splitlines() if line.strip()}
+
+    def write(self, records):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+class ColumnarSink:
+    """A directory of part files, each written atomically (tmp + rename)."""
+
+    def __init__(self, directory, fmt):
+        if fmt == "parquet" and pa is None:
+            raise SystemExit("parquet output needs pyarrow (pip install pyarrow); use --format npz instead")
+        self.directory, self.fmt = Path(directory), fmt
+        self.manifest = self.directory / "_manifest.json"
+
+    def parts(self):
+        return sorted(self.directory.glob(f"part-*.{self.fmt}"))
+
+    def completed(self):
+        done = set()
+        for p in self.parts():
+            if self.fmt == "parquet":
+                rows = pq.read_table(p, columns=["row"]).column("row").to_pylist()
+            else:
+                with np.load(p, allow_pickle=False) as z:
+                    rows = z["row"].tolist()
+            done.update(int(r) for r in rows)
+        return done
+
+    def write(self, records):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        parts = self.parts()
+        n = int(parts[-1].stem.split("-")[1]) + 1 if parts else 0
+        path = self.directory / f"part-{n:05d}.{self.fmt}"
+        tmp = path.with_name(path.name + ".tmp")
+        flat = [flatten(r) for r in records]
+        if self.fmt == "parquet":
+            pq.write_table(pa.Table.from_pylist(flat), tmp)
+        else:
+            with open(tmp, "wb") as f:
+                np.savez(f, **to_arrays(flat))
+        os.replace(tmp, path)
+
+    def clear(self):
+        for p in self.parts():
+            p.unlink()
+
+
+def open_sink(out, fmt):
+    return NDJSONSink(out) if fmt == "ndjson" else ColumnarSink(out, fmt)
+
+
+def check_manifest(sink, manifest, restart):
+    """Refuse to resume into output written for another input or settings."""
+    if restart:
+        sink.clear()
+    elif sink.manifest.exists():
+        previous = json.loads(sink.manifest.read_text(encoding="utf-8"))
+        if previous != manifest:
+            raise SystemExit(f"{sink.manifest} was written for a different input or settings; "
+                             "use --restart to discard the existing output")
+    sink.manifest.parent.mkdir(parents=True, exist_ok=True)
+    sink.manifest.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+
+
+# ---------- Driver ----------
+def chunks(items, size):
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+
+def run(task, rows, sink, settings, workers, chunk, checkpoint, log=sys.stderr):
+    """Run `task` over the rows not yet in `sink`; returns (written, skipped, errors)."""
+    done = sink.completed()
+    todo = [(i, row) for i, row in enumerate(rows) if i not in done]
+    print(f"{len(rows)} rows, {len(done)} already done, {len(todo)} to run on {workers} worker(s)", file=log)
+    if not todo:
+        return 0, len(done), 0
+
+    _app()    # load the backend before forking so workers share it
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    written = errors = 0
+    buffer = []
+    t = time.perf_counter()
+
+    def flush():
+        nonlocal written, buffer
+        if buffer:
+            sink.write(buffer)
+            written += len(buffer)
+            buffer = []
+            rate = written / (time.perf_counter() - t)
+            print(f"  {len(done) + written}/{len(rows)} rows ({rate:,.1f} rows/s)", file=log)
+
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(settings,)) as pool:
+        try:
+            for records in pool.imap_unordered(task, chunks(todo, chunk)):
+                buffer += records
+                errors += sum(1 for r in records if r.get("error"))
+                if len(buffer) >= checkpoint:
+                    flush()
+        finally:
+            flush()    # keep finished rows on Ctrl-C / worker failure, so a re-run resumes
+    return written, len(done), errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline route matrices and emissions reports.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name in ("routes", "matrix", "voyages"):
+        p = sub.add_parser(name)
+        p.add_argument("input", help="CSV or NDJSON file, or - for NDJSON on stdin")
+        p.add_argument("--out", required=True, help="NDJSON file, or directory for parquet / npz parts")
+        p.add_argument("--format", choices=FORMATS, default=None,
+                       help="default: ndjson for .ndjson/.jsonl outputs, else parquet (npz without pyarrow)")
+        p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        p.add_argument("--checkpoint", type=int, default=None, help="records per flush to disk")
+        p.add_argument("--restart", action="store_true", help="discard existing output instead of resuming")
+        p.add_argument("--vessel-type", default=None)
+        p.add_argument("--speed", type=float, default=None, help="default speed_knots")
+        p.add_argument("--fuel-type", default=None)
+        if name != "voyages":
+            p.add_argument("--engine", default=None)
+            p.add_argument("--resolution", type=float, default=None)
+            p.add_argument("--exact", action="store_true")
+            p.add_argument("--no-weather", action="store_true", help="calm sea instead of marine forecasts")
+            p.add_argument("--alternatives", action="store_true", help="also search the alternative route")
+            p.add_argument("--geometry", action="store_true", help="include the main route as an encoded polyline")
+        if name == "matrix":
+            p.add_argument("--symmetric", action="store_true", help="route each unordered pair once")
+    args = parser.parse_args(argv)
+
+    rows, digest = read_rows(args.input)
+    if args.cmd == "matrix":
+        rows = matrix_pairs(rows, args.symmetric)
+
+    defaults = {"vessel_type": args.vessel_type, "speed_knots": args.speed, "fuel_type": args.fuel_type}
+    if args.cmd != "voyages":
+        defaults.update({"engine": args.engine, "resolution": args.resolution, "exact": args.exact or None,
+                         "use_weather": False if args.no_weather else None})
+    settings = {"defaults": {k: v for k, v in defaults.items() if v is not None},
+                "alternatives": bool(getattr(args, "alternatives", False)),
+                "geometry": bool(getattr(args, "geometry", False)),
+                "symmetric": bool(getattr(args, "symmetric", False))}
+
+    fmt = args.format or ("ndjson" if args.out.endswith((".ndjson", ".jsonl"))
+                          else "parquet" if pa is not None else "npz")
+    sink = open_sink(args.out, fmt)
+    check_manifest(sink, {"command": args.cmd, "input_sha1": digest, "rows": len(rows), "settings": settings},
+                   args.restart)
+
+    voyages = args.cmd == "voyages"
+    task, chunk = (voyage_task, VOYAGE_CHUNK) if voyages else (route_task, ROUTE_CHUNK)
+    checkpoint = args.checkpoint or (VOYAGE_CHUNK if voyages else CHECKPOINT_ROWS)
+    t = time.perf_counter()
+    try:
+        written, skipped, errors = run(task, rows, sink, settings, max(1, args.workers), chunk, checkpoint)
+    except KeyboardInterrupt:
+        print("interrupted; finished rows are saved, run the same command again to resume", file=sys.stderr)
+        return 130
+    dt = time.perf_counter() - t
+    print(f"wrote {written} rows to {args.out} ({fmt}) in {dt:.1f}s, {skipped} resumed, {errors} with errors",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
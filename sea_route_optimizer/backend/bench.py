@@ -0,0 +1,436 @@
+# backend/bench.py
+# Routing / emissions benchmark suite with JSON baselines.
+#
+#   python bench.py run --out benchmarks/baseline.json      # record a baseline
+#   python bench.py run --out /tmp/now.json                 # record a run
+#   python bench.py compare benchmarks/baseline.json /tmp/now.json
+#   python bench.py compare benchmarks/baseline.json        # run now, then compare
+#
+# Everything runs in-process: the FastAPI app (app1) through TestClient and the
+# Flask app (app) through its test client. AIS traffic is replaced by seeded
+# synthetic ships and the weather APIs are stubbed, so runs are repeatable and
+# never touch the network. `compare` exits with status 1 when a metric regressed.
+import argparse, gc, json, platform, re, sys, time, datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+
+BENCH_DIR = Path(__file__).parent / "benchmarks"
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+
+# Port pairs are matched by substring like the API does.
+CASES = {
+    "short_coastal": ("Keppel Harbour", "Batam Harbour Bay"),
+    "strait": ("Port of Penang", "Keppel Harbour"),
+    "long_haul": ("Port Klang", "Wong Chuk Kok Hoi"),
+    # No real port pair is disconnected at 0.2°, so the destination is walled
+    # in with synthetic rocks: the search has to exhaust its whole window.
+    "infeasible": ("Keppel Harbour", "Batam Island Port"),
+}
+BLOCKADE_CASES = {"infeasible"}
+SHIP_DENSITIES = (0, 100, 1000)
+HTTP_SHIPS = 100
+ENGINES = ("grid", "pyramid", "quadtree", "visgraph")
+
+# Time-to-first-map-render is modeled from the simulated page load: one round
+# trip per wave (page, then its styles / scripts, then the data they fetch)
+# plus the bytes at this downlink, plus the measured server time.
+MAP_PAGE = "/route"
+MAP_LINK_MBPS = 20.0
+MAP_RTT_MS = 50.0
+BROWSER_ACCEPT_ENCODING = "gzip, deflate, br"
+
+REGRESSION_THRESHOLD = 0.25   # relative slowdown that counts as a regression
+NOISE_FLOOR_MS = 2.0          # ignore absolute changes smaller than this
+
+
+# ---------- Fixtures ----------
+def synthetic_ships(n, bounds, seed=0):
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(bounds["lat_min"], bounds["lat_max"], n)
+    lon = rng.uniform(bounds["lon_min"], bounds["lon_max"], n)
+    return [{"lat": float(a), "lon": float(b), "name": f"Synthetic-{i:05d}"}
+            for i, (a, b) in enumerate(zip(lat, lon))]
+
+
+def blockade(port, res):
+    """Rocks on the 8 cells around a port so its cell has no open neighbour."""
+    return [{"lat": port["lat"] + dr * res, "lon": port["lon"] + dc * res, "name": "bench-blockade"}
+            for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+
+
+class _StubResponse:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class StubRequests:
+    """Stands in for `requests` in the weather endpoint: canned 48 h forecasts."""
+    HOURS = 48
+
+    def get(self, url, *args, **kwargs):
+        n = self.HOURS
+        times = [f"2024-01-0{1 + i // 24}T{i % 24:02d}:00" for i in range(n)]
+        if "marine" in url:
+            hourly = {"time": times, "wave_height": [1.2] * n, "wave_direction": [180] * n, "wave_period": [7.5] * n}
+        else:
+            hourly = {"time": times, "temperature_2m": [28.0] * n, "windspeed_10m": [12.0] * n, "weathercode": [1] * n,
+                      "visibility": [20000] * n, "precipitation": [0.0] * n, "cloudcover": [40] * n}
+        return _StubResponse({"hourly": hourly})
+
+
+@contextmanager
+def patched(module, **attrs):
+    saved = {k: getattr(module, k) for k in attrs}
+    for k, v in attrs.items():
+        setattr(module, k, v)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            setattr(module, k, v)
+
+
+@contextmanager
+def scenario(modules, case, ships):
+    """Synthetic traffic (and the blockade for infeasible cases) on every app module."""
+    if not modules:
+        yield
+        return
+    mod = modules[0]
+    attrs = {"get_ships_near_area": lambda **bounds: ships}
+    if case in BLOCKADE_CASES:
+        dest = find_port(mod, CASES[case][1])
+        attrs["ROCKS"] = mod.ROCKS.extend(blockade(dest, mod.GRID_RES))
+    with patched(mod, **attrs), scenario(modules[1:], case, ships):
+        yield
+
+
+def find_port(mod, name):
+    return mod.PORTS.find(name)
+
+
+# ---------- Measurement ----------
+def timed(fn, repeat):
+    """Run fn `repeat` times with the GC paused (like timeit); returns (ms samples, last result)."""
+    samples, result = [], None
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t = time.perf_counter()
+            result = fn()
+            samples.append((time.perf_counter() - t) * 1000)
+    finally:
+        gc.enable()
+    return samples, result
+
+
+def summarize(samples_ms):
+    s = np.asarray(samples_ms, dtype=np.float64)
+    return {"unit": "ms", "better": "lower", "n": int(s.size), "median": round(float(np.median(s)), 3),
+            "p95": round(float(np.percentile(s, 95)), 3), "min": round(float(s.min()), 3)}
+
+
+def gauge(value, unit, better):
+    return {"unit": unit, "better": better, "median": value}
+
+
+def bench_stages(results, app1, repeat):
+    """Grid build, search, alternatives and serialization, per case and ship density."""
+    for case, (o_name, d_name) in CASES.items():
+        o, d = find_port(app1, o_name), find_port(app1, d_name)
+        start, end = (o["lat"], o["lon"]), (d["lat"], d["lon"])
+        bbox = {"lat_min": min(o["lat"], d["lat"])-3, "lat_max": max(o["lat"], d["lat"])+3,
+                "lon_min": min(o["lon"], d["lon"])-3, "lon_max": max(o["lon"], d["lon"])+3}
+        rmin, cmin = app1.latlon_to_grid(bbox["lat_min"], bbox["lon_min"])
+        rmax, cmax = app1.latlon_to_grid(bbox["lat_max"], bbox["lon_max"])
+
+        for n_ships in SHIP_DENSITIES:
+            ships = synthetic_ships(n_ships, app1.SEA_BOUNDS)
+            tag = f"{case}/ships={n_ships}"
+            with scenario([app1], case, ships):
+                samples, (grid, Rn, Cn) = timed(lambda: app1.build_weight_grid(rmin, rmax, cmin, cmax, dynamic_ships=ships), repeat)
+                results[f"stage/grid_build/{tag}"] = summarize(samples)
+
+                samples, path = timed(lambda: app1.weighted_a_star_sub(start, end, [row[:] for row in grid],
+                                                                       rmin, cmin, Rn, Cn), repeat)
+                results[f"stage/search/{tag}"] = summarize(samples)
+
+                # Heuristic comparison: haversine bound vs landmark (ALT) bounds vs bidirectional ALT
+                for mode in app1.GRID_SEARCHES:
+                    stats = {}
+                    samples, _ = timed(lambda: app1.weighted_a_star_sub(start, end, [row[:] for row in grid], rmin,
+                                                                        cmin, Rn, Cn, stats, mode), repeat)
+                    results[f"search/{mode}/{tag}"] = summarize(samples)
+                    results[f"search_nodes/{mode}/{tag}"] = gauge(stats.get("nodes_expanded", 0) // repeat,
+                                                                  "nodes", "lower")
+
+                if path:
+                    # Same detour penalty as grid_routes: the middle third of the main path.
+                    def alternative():
+                        alt_grid = [row[:] for row in grid]
+                        for lat, lon in path[len(path)//3:2*len(path)//3]:
+                            rr, cc = app1.latlon_to_grid(lat, lon)
+                            if rmin <= rr <= rmax and cmin <= cc <= cmax:
+                                alt_grid[rr-rmin][cc-cmin] = max(alt_grid[rr-rmin][cc-cmin], 200.0)
+                        return app1.weighted_a_star_sub(start, end, alt_grid, rmin, cmin, Rn, Cn)
+                    samples, _ = timed(alternative, repeat)
+                    results[f"stage/alternatives/{tag}"] = summarize(samples)
+
+                if n_ships != HTTP_SHIPS or case in BLOCKADE_CASES:
+                    continue
+                for engine in ENGINES:
+                    req = app1.RouteRequest(origin=o_name, destination=d_name, engine=engine)
+                    samples, _ = timed(lambda: app1.plan_route(req), repeat)
+                    results[f"engine/{engine}/{case}"] = summarize(samples)
+
+                body = app1.optimize_route_body(app1.plan_route(app1.RouteRequest(origin=o_name, destination=d_name)))
+                samples, payload = timed(lambda: app1.RawJSONResponse(body).body, repeat)
+                results[f"stage/serialize/{case}"] = summarize(samples)
+                results[f"payload_bytes/optimize-route/{case}"] = gauge(len(payload), "bytes", "lower")
+
+
+def bench_emissions(results, app1, repeat):
+    from fleet_emissions import evaluate, voyages_to_columns
+    rng = np.random.default_rng(1)
+    n = 10000
+    voyages = [{"vessel_type": v, "speed_knots": float(s), "distance_nm": float(dist), "fuel_type": f,
+                "weather_resistance": float(w)}
+               for v, s, dist, f, w in zip(rng.choice(list(app1.BASE_RATES), n), rng.uniform(4, 25, n),
+                                           rng.uniform(50, 5000, n), rng.choice(list(app1.EMISSION_FACTORS), n),
+                                           rng.uniform(1.0, 1.3, n))]
+    cols = voyages_to_columns(voyages)
+    samples, _ = timed(lambda: evaluate(cols, app1.FLEET_TABLES), repeat)
+    results[f"emissions/batch_kernel/{n}"] = summarize(samples)
+    reqs = [app1.CalcRequest(**v) for v in voyages[:1000]]
+    samples, _ = timed(lambda: [app1.calculate(r) for r in reqs], repeat)
+    results["emissions/scalar_calculate/1000"] = summarize(samples)
+
+
+def http_calls(app1):
+    """(label, method, path, kwargs) for the FastAPI and Flask apps."""
+    calls = []
+    for case, (o, d) in CASES.items():
+        body = {"origin": o, "destination": d}
+        calls.append((f"fastapi/optimize-route/{case}", "post", "/api/optimize-route", {"json": body}))
+        calls.append((f"flask/optimize-route/{case}", "post", "/api/optimize-route", {"json": body}))
+    o, d = CASES["strait"]
+    calls.append(("fastapi/route-emissions/strait", "post", "/api/route-emissions",
+                  {"json": {"origin": o, "destination": d, "vessel_type": "medium_cargo",
+                            "speed_knots": 12, "fuel_type": "MDO"}}))
+    calls.append(("fastapi/calculate", "post", "/api/calculate",
+                  {"json": {"vessel_type": "medium_cargo", "speed_knots": 14, "distance_nm": 1200, "fuel_type": "HFO"}}))
+    calls.append(("fastapi/weather", "get", "/weather", {"params": {"lat": 1.3, "lon": 103.8}}))
+    return calls
+
+
+def bench_http(results, app1, flask_app, repeat, concurrency):
+    from fastapi.testclient import TestClient
+
+    def client_for(label):
+        return TestClient(app1.app) if label.startswith("fastapi") else flask_app.app.test_client()
+
+    ships = synthetic_ships(HTTP_SHIPS, app1.SEA_BOUNDS)
+    heights = lambda lat, lon: 1.0 + (abs(lat) % 1.0)
+    with patched(app1, requests=StubRequests()), patched(app1.WEATHER_CACHE, fetch=heights):
+        for label, method, path, kwargs in http_calls(app1):
+            case = label.split("/")[-1]
+            with scenario([app1, flask_app], case if case in CASES else None, ships):
+                client = client_for(label)
+                call = lambda c=client: getattr(c, method)(path, **kwargs)
+                call()   # warm caches (weather cells, lazily built structures)
+                samples, resp = timed(call, repeat)
+                results[f"http/latency/{label}"] = summarize(samples)
+                results[f"http/status/{label}"] = gauge(resp.status_code, "code", "equal")
+
+                clients = [client_for(label) for _ in range(concurrency)]
+                n = repeat * concurrency
+                t = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    list(pool.map(lambda i: getattr(clients[i % concurrency], method)(path, **kwargs), range(n)))
+                rps = n / (time.perf_counter() - t)
+                results[f"http/throughput/{label}"] = gauge(round(rps, 2), "req/s", "higher")
+
+
+class BrowserCache:
+    """Just enough of an HTTP cache: immutable responses are reused without a
+    request, others are revalidated with If-None-Match."""
+    def __init__(self):
+        self.entries = {}     # url -> (etag, immutable, body text)
+
+    def fetch(self, client, url):
+        """(body text, bytes on the wire, requests made, server ms)."""
+        entry = self.entries.get(url)
+        if entry and entry[1]:
+            return entry[2], 0, 0, 0.0
+        headers = {"Accept-Encoding": BROWSER_ACCEPT_ENCODING}
+        if entry and entry[0]:
+            headers["If-None-Match"] = entry[0]
+        t = time.perf_counter()
+        r = client.get(url, headers=headers)
+        ms = (time.perf_counter() - t) * 1000
+        if r.status_code == 304:
+            return entry[2], r.num_bytes_downloaded, 1, ms
+        body = r.text if r.status_code == 200 else ""
+        cache_control = r.headers.get("cache-control", "")
+        if r.status_code == 200 and (r.headers.get("etag") or "immutable" in cache_control):
+            self.entries[url] = (r.headers.get("etag"), "immutable" in cache_control, body)
+        return body, r.num_bytes_downloaded, 1, ms
+
+
+def map_page_load(client, cache, page=MAP_PAGE):
+    """Load the route page the way the browser does before the map can draw:
+    the page, its stylesheets and scripts, then the GeoJSON overlays and the
+    port list the script fetches. Returns (bytes, requests, server ms, modeled ms)."""
+    total_bytes = total_requests = 0
+    server_ms = modeled_ms = 0.0
+    wave = [page]
+    while wave:
+        refs, wave_bytes, wave_requests, wave_ms = [], 0, 0, 0.0
+        for url in wave:
+            body, n_bytes, n_requests, ms = cache.fetch(client, url)
+            wave_bytes, wave_requests, wave_ms = wave_bytes + n_bytes, wave_requests + n_requests, max(wave_ms, ms)
+            if url == page:
+                refs += [re.sub(r"^(\.\./)+", "/", ref) for ref in re.findall(r'(?:href|src)="([^"]+\.(?:css|js))"', body)
+                         if not ref.startswith("http")]
+            elif url.endswith(".js"):
+                refs += re.findall(r"['\"](/data/[^'\"]+|/api/ports)['\"]", body)
+        total_bytes, total_requests, server_ms = total_bytes + wave_bytes, total_requests + wave_requests, server_ms + wave_ms
+        if wave_requests:
+            modeled_ms += MAP_RTT_MS + wave_bytes * 8 / (MAP_LINK_MBPS * 1000) + wave_ms
+        wave = list(dict.fromkeys(refs))
+    return total_bytes, total_requests, server_ms, modeled_ms
+
+
+def bench_assets(results, app1, flask_app, repeat):
+    """Bytes on the wire and modeled time-to-first-map-render for the route page,
+    first visit and repeat visit, plus the islands overlay from the Flask app."""
+    from fastapi.testclient import TestClient
+    client = TestClient(app1.app)
+    samples = {"cold": [], "warm": []}
+    for _ in range(repeat):
+        cache = BrowserCache()
+        for visit in ("cold", "warm"):
+            samples[visit].append(map_page_load(client, cache))
+    for visit, loads in samples.items():
+        n_bytes, n_requests, _, _ = loads[-1]
+        results[f"assets/map_page/bytes/{visit}"] = gauge(n_bytes, "bytes", "lower")
+        results[f"assets/map_page/requests/{visit}"] = gauge(n_requests, "requests", "lower")
+        results[f"assets/map_page/server/{visit}"] = summarize([load[2] for load in loads])
+        results[f"assets/map_page/first_render_model/{visit}"] = summarize([load[3] for load in loads])
+
+    flask_client = flask_app.app.test_client()
+    r = flask_client.get("/data/islands.geojson", headers={"Accept-Encoding": BROWSER_ACCEPT_ENCODING})
+    results["assets/flask/islands_bytes"] = gauge(len(r.data), "bytes", "lower")
+
+
+def run(repeat=5, concurrency=4, only=("stages", "emissions", "http", "assets")):
+    t = time.perf_counter()
+    import app1
+    import_s = time.perf_counter() - t
+    t = time.perf_counter()
+    import app as flask_app
+    flask_import_s = time.perf_counter() - t
+
+    results = {"startup/import_app1": gauge(round(import_s * 1000, 3), "ms", "lower"),
+               "startup/import_flask_app": gauge(round(flask_import_s * 1000, 3), "ms", "lower")}
+    if "stages" in only:
+        bench_stages(results, app1, repeat)
+    if "emissions" in only:
+        bench_emissions(results, app1, repeat)
+    if "http" in only:
+        bench_http(results, app1, flask_app, repeat, concurrency)
+    if "assets" in only:
+        bench_assets(results, app1, flask_app, repeat)
+    return {
+        "meta": {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "machine": platform.machine(),
+                 "platform": platform.platform(), "repeat": repeat, "concurrency": concurrency},
+        "results": results,
+    }
+
+
+# ---------- Comparison ----------
+def _value(entry):
+    # Timings compare on the fastest sample: it is far less noisy than the median.
+    return entry.get("min", entry["median"])
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD, noise_ms=NOISE_FLOOR_MS):
+    """Rows of (key, base, now, change, verdict); verdict is 'REGRESSION', 'improved', 'ok', 'new' or 'missing'."""
+    base, now = baseline["results"], current["results"]
+    rows = []
+    for key in sorted(set(base) | set(now)):
+        if key not in now:
+            rows.append((key, _value(base[key]), None, None, "missing"))
+            continue
+        if key not in base:
+            rows.append((key, None, _value(now[key]), None, "new"))
+            continue
+        b, c, better = _value(base[key]), _value(now[key]), now[key]["better"]
+        if better == "equal":
+            rows.append((key, b, c, None, "ok" if b == c else "REGRESSION"))
+            continue
+        change = (c - b) / b if b else 0.0
+        worse = change > threshold if better == "lower" else change < -threshold
+        if now[key]["unit"] == "ms" and abs(c - b) < noise_ms:
+            worse = False
+        improved = change < -threshold if better == "lower" else change > threshold
+        rows.append((key, b, c, change, "REGRESSION" if worse else "improved" if improved else "ok"))
+    return rows
+
+
+def print_rows(rows):
+    fmt = lambda v: "-" if v is None else f"{v:.3f}" if isinstance(v, float) else str(v)
+    width = max(len(r[0]) for r in rows)
+    for key, b, c, change, verdict in rows:
+        pct = "" if change is None else f"{change*100:+7.1f}%"
+        print(f"{key:<{width}}  {fmt(b):>12}  {fmt(c):>12}  {pct:>9}  {verdict}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1] if __doc__ else None)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run")
+    p_run.add_argument("--out", type=Path, default=None)
+    p_cmp = sub.add_parser("compare")
+    p_cmp.add_argument("baseline", type=Path, nargs="?", default=DEFAULT_BASELINE)
+    p_cmp.add_argument("current", type=Path, nargs="?", default=None)
+    p_cmp.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    for p in (p_run, p_cmp):
+        p.add_argument("--repeat", type=int, default=5)
+        p.add_argument("--concurrency", type=int, default=4)
+        p.add_argument("--only", default="stages,emissions,http,assets")
+    args = parser.parse_args(argv)
+    only = tuple(args.only.split(","))
+
+    if args.cmd == "run":
+        report = run(args.repeat, args.concurrency, only)
+        out = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.out:
+            args.out.parent.mkdir(parents=True, exist_ok=True)
+            args.out.write_text(out + "\n", encoding="utf-8")
+            print(f"wrote {len(report['results'])} metrics to {args.out}")
+        else:
+            print(out)
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if args.current:
+        current = json.loads(args.current.read_text(encoding="utf-8"))
+    else:
+        current = run(args.repeat, args.concurrency, only)
+    rows = compare(baseline, current, args.threshold)
+    print_rows(rows)
+    regressions = [r for r in rows if r[4] == "REGRESSION"]
+    print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# backend/compliance.py
+# Data-driven MARPOL checks and geofenced zone checks along routes.
+#
+# Vessel rules come from data/compliance_rules.json and are compiled into
+# lookup arrays indexed by vessel / fuel code, so one rule evaluates a whole
+# batch with a couple of NumPy operations. Zones (ECAs, restricted areas)
+# come from data/geofences.geojson and sit in an STRtree that route legs
+# are intersected against.
+import json
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+from geo import haversine_nm_np
+
+
+class CompiledRules:
+    """Vessel rules bound to the vessel / fuel code order of a FleetTables.
+
+    Fuel code -1 (unknown fuel) hits the extra last column, which forbids nothing.
+    """
+
+    def __init__(self, rules, vessels, fuels):
+        self.rules = rules
+        self.ids = [r["id"] for r in rules]
+        self.tables = []
+        for r in rules:
+            if r["kind"] == "max":
+                table = np.array([r["limits"].get(v, np.inf) for v in vessels], dtype=np.float64)
+            elif r["kind"] == "forbidden_fuel":
+                table = np.zeros((len(vessels), len(fuels) + 1), dtype=bool)
+                for i, v in enumerate(vessels):
+                    for f in r["fuels"].get(v, []):
+                        if f in fuels:
+                            table[i, fuels.index(f)] = True
+            else:
+                raise ValueError(f"unknown rule kind '{r['kind']}'")
+            self.tables.append(table)
+
+    def failed(self, vessel_codes, fuel_codes, values):
+        """{rule id: bool array of failures}. `values` maps field -> array."""
+        out = {}
+        for r, table in zip(self.rules, self.tables):
+            if r["kind"] == "max":
+                out[r["id"]] = np.asarray(values[r["field"]]) > table[vessel_codes]
+            else:
+                out[r["id"]] = table[vessel_codes, fuel_codes]
+        return out
+
+    def messages(self, rule_id):
+        r = self.rules[self.ids.index(rule_id)]
+        return r["pass"], r["fail"]
+
+
+class ComplianceEngine:
+    def __init__(self, rules, zones):
+        self.vessel_rules = rules.get("vessel_rules", [])
+        self.zone_rules = {z["zone_type"]: z for z in rules.get("zone_rules", [])}
+        self.zones = zones
+        self.zone_geoms = np.array([shape(z["geometry"]) for z in zones])
+        self.zone_tree = STRtree(self.zone_geoms) if len(zones) else None
+        self._compiled = {}
+        self.rule_vessels = list(dict.fromkeys(v for r in self.vessel_rules
+                                               for v in r.get("limits", r.get("fuels", {}))))
+        self.rule_fuels = list(dict.fromkeys(f for r in self.vessel_rules
+                                             for fs in r.get("fuels", {}).values() for f in fs))
+        # Unknown vessel types map to the trailing None entry, which no rule limits.
+        self._scalar = self.compile(self.rule_vessels + [None], self.rule_fuels)
+
+    @classmethod
+    def from_files(cls, rules_path, zones_path):
+        with open(rules_path, encoding="utf-8") as f:
+            rules = json.load(f)
+        zones = []
+        try:
+            with open(zones_path, encoding="utf-8") as f:
+                zones = json.load(f).get("features", [])
+        except FileNotFoundError:
+            pass
+        return cls(rules, zones)
+
+    def compile(self, vessels, fuels):
+        key = (tuple(vessels), tuple(fuels))
+        if key not in self._compiled:
+            self._compiled[key] = CompiledRules(self.vessel_rules, list(vessels), list(fuels))
+        return self._compiled[key]
+
+    def check(self, vessel_type, fuel_type, co2_kg, speed_knots):
+        """Single voyage, same output shape as check_marpol_limits."""
+        rules = self._scalar
+        vt = self.rule_vessels.index(vessel_type) if vessel_type in self.rule_vessels else len(self.rule_vessels)
+        ft = self.rule_fuels.index(fuel_type) if fuel_type in self.rule_fuels else -1
+        failed = rules.failed(np.array([vt]), np.array([ft]), {"co2_kg": [co2_kg], "speed_knots": [speed_knots]})
+        return {rid: {"message": rules.messages(rid)[bool(f[0])], "passed": not bool(f[0])}
+                for rid, f in failed.items()}
+
+    # ---------- Geofences ----------
+    def zones_along(self, path, fuel_type=None):
+        """Legs of a (lat, lon) path that enter a zone, with the distance sailed inside."""
+        if self.zone_tree is None or len(path) < 2:
+            return []
+        pts = np.asarray(path, dtype=np.float64)[:, ::-1]          # -> (lon, lat)
+        legs = shapely.linestrings(np.stack([pts[:-1], pts[1:]], axis=1))
+        leg_idx, zone_idx = self.zone_tree.query(legs, predicate="intersects")
+        if not len(leg_idx):
+            return []
+        leg_nm = haversine_nm_np(pts[:-1, 1], pts[:-1, 0], pts[1:, 1], pts[1:, 0])
+        inside = shapely.length(shapely.intersection(legs[leg_idx], self.zone_geoms[zone_idx]))
+        inside_nm = leg_nm[leg_idx] * inside / np.maximum(shapely.length(legs[leg_idx]), 1e-12)
+
+        hits = []
+        for leg, z, nm in zip(leg_idx.tolist(), zone_idx.tolist(), inside_nm.tolist()):
+            props = self.zones[z].get("properties", {})
+            zone_type = props.get("zone_type", "restricted")
+            rule = self.zone_rules.get(zone_type, {})
+            if rule.get("always_fail"):
+                passed = False
+            elif fuel_type is None:
+                passed = None
+            else:
+                passed = fuel_type not in rule.get("forbidden_fuels", [])
+            message = rule.get("info", zone_type) if passed is None else rule.get("pass" if passed else "fail", zone_type)
+            hits.append({"leg": leg, "zone": props.get("name", f"zone-{z}"), "zone_type": zone_type,
+                         "inside_nm": round(nm, 2), "passed": passed, "message": message})
+        return hits
@@ -0,0 +1,260 @@
+# backend/fleet_emissions.py
+# NumPy kernels for evaluating many voyages at once with the same model as
+# /api/calculate (compute_fuel, compute_emissions, get_badge, check_marpol_limits).
+import json
+import numpy as np
+
+SCENARIOS = ("eco", "balanced", "fastest")
+CHUNK_ROWS = 10000
+
+BADGES = ("🚢 Standard Mode", "💨 Low Emission Rider", "🌱 Carbon Cutter")
+
+
+class FleetTables:
+    """Lookup arrays built from the BASE_RATES / EMISSION_FACTORS / ECO_BADGES
+    dicts, plus the compliance rules compiled for the same vessel / fuel codes."""
+
+    def __init__(self, base_rates, emission_factors, eco_badges, compliance,
+                 default_vessel="medium_cargo", default_fuel="HFO"):
+        self.vessels = list(base_rates)
+        self.fuels = list(emission_factors)
+        self.vessel_index = {v: i for i, v in enumerate(self.vessels)}
+        self.fuel_index = {f: i for i, f in enumerate(self.fuels)}
+        self.default_vessel = self.vessel_index[default_vessel]
+        self.default_fuel = self.fuel_index[default_fuel]
+        self.base_rate = np.array([base_rates[v]["base_rate"] for v in self.vessels])
+        self.nominal_speed = np.array([base_rates[v]["nominal_speed"] for v in self.vessels])
+        self.ef = np.array([emission_factors[f] for f in self.fuels])
+        self.rules = compliance.compile(self.vessels, self.fuels)
+        self.badge_thresholds = (eco_badges["low_emission_rider"], eco_badges["carbon_cutter"])
+
+    def encode(self, names, index, default):
+        """Map names to codes; unknown names fall back to `default`."""
+        return np.fromiter((index.get(n, default) for n in names), dtype=np.int16, count=len(names))
+
+
+# ---------- Input ----------
+COLUMNS = ("vessel_type", "speed_knots", "distance_nm", "fuel_type", "weather_resistance")
+
+
+REQUIRED = ("vessel_type", "speed_knots", "distance_nm", "fuel_type")
+NAME_COLUMNS = ("vessel_type", "fuel_type")
+NUMBER_COLUMNS = ("speed_knots", "distance_nm", "weather_resistance")
+
+
+def voyages_to_columns(voyages):
+    """List of /api/calculate-style dicts -> dict of checked columns."""
+    for i, v in enumerate(voyages):
+        if not isinstance(v, dict):
+            raise ValueError(f"voyage {i}: expected an object")
+    return check_columns({k: [v.get(k) for v in voyages] for k in COLUMNS})
+
+
+def _number_column(name, values):
+    if all(type(x) in (int, float) for x in values):
+        arr = np.asarray(values, dtype=np.float64)
+    else:
+        arr = np.empty(len(values))
+        for i, x in enumerate(values):
+            if x is None:
+                raise ValueError(f"row {i}: {name} is required")
+            try:
+                if isinstance(x, bool) or not isinstance(x, (int, float, str)):
+                    raise ValueError
+                arr[i] = float(x)
+            except ValueError:
+                raise ValueError(f"row {i}: {name} must be a number, got {json.dumps(x)}") from None
+    bad = np.flatnonzero(~np.isfinite(arr))
+    if len(bad):
+        raise ValueError(f"row {bad[0]}: {name} must be finite")
+    return arr
+
+
+def check_columns(cols):
+    """Validate and coerce columns the way CalcRequest validates one voyage:
+    vessel_type, speed_knots, distance_nm and fuel_type are required, numbers
+    must be finite (numeric strings are accepted), weather_resistance defaults
+    to 1.0, and every column has the same length. Raises ValueError."""
+    missing = [k for k in REQUIRED if cols.get(k) is None]
+    if missing:
+        raise ValueError(f"missing field(s): {', '.join(missing)}")
+    n = len(cols["distance_nm"]) if isinstance(cols["distance_nm"], list) else 0
+    if cols.get("weather_resistance") is None:
+        cols = {**cols, "weather_resistance": [None] * n}
+    out = {}
+    for k in COLUMNS:
+        values = cols[k]
+        if not isinstance(values, list):
+            raise ValueError(f"{k}: expected an array")
+        if len(values) != n:
+            raise ValueError(f"{k}: {len(values)} values, expected {n} like distance_nm")
+        if k in NAME_COLUMNS:
+            bad = next((i for i, x in enumerate(values) if not isinstance(x, str)), None)
+            if bad is not None:
+                raise ValueError(f"row {bad}: {k} is required and must be a string")
+            out[k] = values
+        else:
+            if k == "weather_resistance":
+                values = [1.0 if x is None else x for x in values]
+            out[k] = _number_column(k, values)
+    return out
+
+
+def parse_batch(body, content_type=""):
+    """Accept NDJSON, a JSON list of voyages, {"voyages": [...]} or a dict of
+    column arrays. Returns a dict of checked columns; raises ValueError for
+    anything /api/calculate would reject, before any result is streamed."""
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return voyages_to_columns([json.loads(line) for line in body.splitlines() if line.strip()])
+    data = json.loads(body)
+    if isinstance(data, dict) and "voyages" in data:
+        data = data["voyages"]
+    if isinstance(data, list):
+        return voyages_to_columns(data)
+    if isinstance(data, dict):
+        return check_columns(data)
+    raise ValueError("expected NDJSON, a list of voyages or a dict of column arrays")
+
+
+# ---------- Kernels ----------
+def fuel_kernel(base_rate, nominal_speed, speed, distance_nm, weather_resistance):
+    safe_nominal = np.where(nominal_speed > 0, nominal_speed, 1.0)
+    speed_factor = np.where(nominal_speed > 0, np.maximum(speed / safe_nominal, 0.5), 1.0)
+    return base_rate * distance_nm * speed_factor * weather_resistance
+
+
+def scenario_speeds(requested, nominal):
+    """eco / balanced / fastest speeds as chosen by calculate()."""
+    return {
+        "eco": np.maximum(requested - 2.0, 4.0),
+        "balanced": np.maximum(np.minimum(nominal, requested), 4.0),
+        "fastest": np.minimum(requested + 2.0, 30.0),
+    }
+
+
+def evaluate(cols, tables):
+    """Vectorized equivalent of calculate() for every row of `cols`."""
+    vt = tables.encode(cols["vessel_type"], tables.vessel_index, tables.default_vessel)
+    ft = tables.encode(cols["fuel_type"], tables.fuel_index, -1)   # -1 = unknown fuel
+    distance = np.asarray(cols["distance_nm"], dtype=np.float64)
+    speed_req = np.asarray(cols["speed_knots"], dtype=np.float64)
+    wr = np.asarray(cols["weather_resistance"], dtype=np.float64)
+
+    base_rate, nominal = tables.base_rate[vt], tables.nominal_speed[vt]
+    ef = tables.ef[np.where(ft < 0, tables.default_fuel, ft)]   # unknown fuels are costed as HFO
+    requested = np.maximum(speed_req, 1.0)
+    speeds = scenario_speeds(requested, nominal)
+
+    out = {"vessel_type": vt, "fuel_type_code": ft, "distance_nm": distance, "requested_speed": requested,
+           "weather_resistance": wr}
+    for label, speed in speeds.items():
+        fuel = fuel_kernel(base_rate, nominal, speed, distance, wr)
+        co2 = fuel * ef
+        out[label] = {
+            "speed_knots": speed, "fuel_liters": fuel, "co2_kg": co2,
+            "eta_hours": distance / speed,
+            "failed": tables.rules.failed(vt, ft, {"co2_kg": co2, "speed_knots": speed}),
+        }
+
+    out["baseline_co2_kg"] = fuel_kernel(base_rate, nominal, nominal, distance, 1.0) * ef
+    return out
+
+
+# ---------- Output ----------
+def _round2(values):
+    """Python round() of each value, as calculate() rounds (np.round differs on ties)."""
+    return [round(x, 2) for x in values.tolist()]
+
+
+def _compliance(rules, failed, i):
+    return {rid: {"message": rules.messages(rid)[failed[rid][i]], "passed": not failed[rid][i]}
+            for rid in rules.ids}
+
+
+def iter_records(cols, result, tables, compact=False):
+    """Yield one dict per voyage: /api/calculate's response shape, or a flat
+    record with compliance as booleans when `compact` is set."""
+    n = len(result["distance_nm"])
+    vessel_names = [tables.vessels[i] for i in result["vessel_type"].tolist()]
+    fuel_names = cols["fuel_type"]
+    baseline_raw = result["baseline_co2_kg"].tolist()
+    baseline = [round(b, 2) for b in baseline_raw]
+    sc = {label: {k: _round2(v) for k, v in result[label].items() if k != "failed"}
+          for label in SCENARIOS}
+    failed = {label: {rid: f.tolist() for rid, f in result[label]["failed"].items()} for label in SCENARIOS}
+    # From the rounded eco CO2, like calculate()
+    improvement = [round((b - eco) / b * 100, 2) if b > 0 else 0.0
+                   for b, eco in zip(baseline_raw, sc["eco"]["co2_kg"])]
+    low, high = tables.badge_thresholds
+    badge = [2 if imp >= high else 1 if imp >= low else 0 for imp in improvement]
+    distance = result["distance_nm"].tolist()
+    requested = result["requested_speed"].tolist()
+    wr = result["weather_resistance"].tolist()
+
+    for i in range(n):
+        if compact:
+            rec = {"vessel_type": vessel_names[i], "fuel_type": fuel_names[i], "distance_nm": distance[i],
+                   "baseline_co2_kg": baseline[i], "eco_improvement_pct": improvement[i],
+                   "eco_rating_badge": BADGES[badge[i]]}
+            for label in SCENARIOS:
+                s = sc[label]
+                rec[f"{label}_speed_knots"] = s["speed_knots"][i]
+                rec[f"{label}_fuel_liters"] = s["fuel_liters"][i]
+                rec[f"{label}_co2_kg"] = s["co2_kg"][i]
+                rec[f"{label}_eta_hours"] = s["eta_hours"][i]
+                rec[f"{label}_compliant"] = not any(f[i] for f in failed[label].values())
+            yield rec
+            continue
+        scenarios = {}
+        for label in SCENARIOS:
+            s = sc[label]
+            scenarios[label] = {"speed_knots": s["speed_knots"][i], "fuel_liters": s["fuel_liters"][i],
+                                "co2_kg": s["co2_kg"][i], "eta_hours": s["eta_hours"][i],
+                                "marpol_compliance": _compliance(tables.rules, failed[label], i)}
+        yield {"vessel_type": vessel_names[i], "distance_nm": distance[i], "requested_speed": requested[i],
+               "fuel_type": fuel_names[i], "weather_resistance": wr[i],
+               "baseline_co2_kg": baseline[i], "eco_improvement_pct": improvement[i],
+               "eco_rating_badge": BADGES[badge[i]], "scenarios": scenarios}
+
+
+def stream_ndjson(cols, tables, compact=False, chunk=CHUNK_ROWS):
+    """Evaluate `cols` in chunks and yield NDJSON bytes, so the first rows go
+    out before the whole batch is done."""
+    n = len(cols["distance_nm"])
+    for start in range(0, n, chunk):
+        part = {k: v[start:start+chunk] for k, v in cols.items()}
+        result = evaluate(part, tables)
+        yield "".join(json.dumps(rec, ensure_ascii=False) + "\n"
+                      for rec in iter_records(part, result, tables, compact)).encode("utf-8")
+
+
+if __name__ == "__main__":
+    # Throughput benchmark: python fleet_emissions.py --voyages 100000
+    import argparse, time
+    from pathlib import Path
+    from compliance import ComplianceEngine
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--voyages", type=int, default=100000)
+    args = parser.parse_args()
+
+    base_rates = {"small_coastal": {"base_rate": 0.25, "nominal_speed": 10.0},
+                  "medium_cargo": {"base_rate": 0.9, "nominal_speed": 12.0},
+                  "large_container": {"base_rate": 2.8, "nominal_speed": 18.0}}
+    data_dir = Path(__file__).parent / "data"
+    compliance = ComplianceEngine.from_files(data_dir / "compliance_rules.json", data_dir / "geofences.geojson")
+    tables = FleetTables(base_rates, {"HFO": 3.114, "MDO": 3.206, "LNG": 2.75},
+                         {"carbon_cutter": 20.0, "low_emission_rider": 10.0}, compliance)
+    rng = np.random.default_rng(0)
+    n = args.voyages
+    cols = {"vessel_type": rng.choice(list(base_rates), n).tolist(),
+            "speed_knots": rng.uniform(4, 25, n).tolist(),
+            "distance_nm": rng.uniform(50, 5000, n).tolist(),
+            "fuel_type": rng.choice(["HFO", "MDO", "LNG"], n).tolist(),
+            "weather_resistance": rng.uniform(1.0, 1.3, n).tolist()}
+
+    t = time.perf_counter(); evaluate(cols, tables); t_kernel = time.perf_counter() - t
+    for compact in (True, False):
+        t = time.perf_counter(); size = sum(len(b) for b in stream_ndjson(cols, tables, compact)); dt = time.perf_counter() - t
+        print(f"{'compact' if compact else 'full':>7}: {n} voyages in {dt:.2f}s ({n/dt:,.0f}/s, {size/1e6:.1f} MB NDJSON)")
+    print(f" kernel: {n} voyages in {t_kernel*1000:.1f} ms ({n/t_kernel:,.0f}/s)")
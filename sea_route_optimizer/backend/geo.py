@@ -0,0 +1,23 @@
+# backend/geo.py
+# Shared great-circle helpers (scalar + numpy) used by the routing modules.
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_TO_NM = 0.539957
+
+
+def haversine_nm(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
+    c = 2 * math.asin(min(1, math.sqrt(a)))
+    return EARTH_RADIUS_KM * c * KM_TO_NM
+
+
+def haversine_nm_np(lat1, lon1, lat2, lon2):
+    """Element-wise haversine distance in nautical miles for array inputs."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1)/2)**2
+    c = 2 * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+    return EARTH_RADIUS_KM * c * KM_TO_NM
@@ -0,0 +1,338 @@
+# backend/geodata.py
+# Compact columnar copies of the static map layers (island / land polygons,
+# rocks, ports).
+#
+# The GeoJSON / Overpass sources are parsed once by `ingest` and reduced to
+# what the backend uses: polygon coordinates as one (n, 2) lon/lat buffer with
+# ring / part / feature offsets (the shapely.to_ragged_array layout), points as
+# lat / lon float arrays, and names interned as int32 codes into a small name
+# table. Tags, feature metadata and the nested dicts of the sources are
+# dropped. The result is cached in data/cache/geodata.npz, keyed on the source
+# files, so a restart loads a few flat arrays instead of parsing JSON.
+#
+# Layers that go to the browser unchanged (islands, rocks) are also kept as
+# pre-encoded GeoJSON feature arrays (RawJSON) and spliced into responses by
+# `dumps`, so requests neither hold nor re-encode the feature dicts.
+#
+#   python geodata.py      # (re)ingest the sources and report the memory saved
+import json, logging, os, uuid
+from pathlib import Path
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+GEODATA_VERSION = 1
+COORD_DECIMALS = 6        # ~0.1 m; precision of the coordinates sent to clients
+
+
+def intern(names):
+    """(int32 codes, unique name array) for a list of names."""
+    table, codes = np.unique(np.array(names, dtype=str), return_inverse=True)
+    return codes.astype(np.int32), table
+
+
+class RawJSON:
+    """A pre-encoded JSON value, inserted verbatim by `dumps`."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+_RAW_MARK = f"@@raw-{uuid.uuid4().hex}-"
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON like Starlette's JSONResponse, with RawJSON values spliced in."""
+    raws = []
+
+    def default(value):
+        if isinstance(value, RawJSON):
+            raws.append(value.data)
+            return f"{_RAW_MARK}{len(raws) - 1}"
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    out = json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=default).encode("utf-8")
+    for i, data in enumerate(raws):
+        out = out.replace(f'"{_RAW_MARK}{i}"'.encode(), data, 1)
+    return out
+
+
+def _coord_strings(coords):
+    return [f"[{x},{y}]" for x, y in np.round(coords, COORD_DECIMALS).tolist()]
+
+
+# ---------- Tables ----------
+class PointTable:
+    """Named points as parallel lat / lon arrays.
+
+    Indexing and iteration give {"lat", "lon", "name"} dicts like the old lists
+    of points; hot paths should use the arrays."""
+
+    def __init__(self, lat, lon, name_codes, names):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.name_codes = np.asarray(name_codes, dtype=np.int32)
+        self.names = np.asarray(names, dtype=str)
+        self._lower = np.char.lower(self.names)
+        self._features = None
+
+    @classmethod
+    def from_records(cls, records):
+        codes, names = intern([p["name"] for p in records] or [""])
+        return cls([p["lat"] for p in records], [p["lon"] for p in records], codes[:len(records)], names)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __getitem__(self, i):
+        return {"lat": float(self.lat[i]), "lon": float(self.lon[i]), "name": str(self.names[self.name_codes[i]])}
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def records(self):
+        names = self.names[self.name_codes].tolist()
+        return [{"lat": a, "lon": b, "name": n} for a, b, n in zip(self.lat.tolist(), self.lon.tolist(), names)]
+
+    def extend(self, records):
+        """New table with extra {"lat", "lon", "name"} points appended."""
+        return PointTable.from_records(self.records() + list(records))
+
+    def find(self, text):
+        """First point whose name contains `text` (case-insensitive), or None."""
+        hit = np.flatnonzero(np.char.find(self._lower, text.lower()) >= 0)
+        if not len(hit):
+            return None
+        rows = np.flatnonzero(np.isin(self.name_codes, hit))
+        return self[int(rows[0])] if len(rows) else None
+
+    def features_json(self):
+        """GeoJSON Point features (name property only), encoded once."""
+        if self._features is None:
+            names = [json.dumps(n, ensure_ascii=False) for n in self.names.tolist()]
+            xy = _coord_strings(np.stack([self.lon, self.lat], axis=1))
+            parts = [f'{{"type":"Feature","properties":{{"name":{names[c]}}},'
+                     f'"geometry":{{"type":"Point","coordinates":{p}}}}}'
+                     for c, p in zip(self.name_codes.tolist(), xy)]
+            self._features = RawJSON(("[" + ",".join(parts) + "]").encode("utf-8"))
+        return self._features
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}_lat": self.lat, f"{prefix}_lon": self.lon,
+                f"{prefix}_name_codes": self.name_codes, f"{prefix}_names": self.names}
+
+    @classmethod
+    def from_arrays(cls, data, prefix):
+        return cls(data[f"{prefix}_lat"], data[f"{prefix}_lon"], data[f"{prefix}_name_codes"], data[f"{prefix}_names"])
+
+
+class PolygonTable:
+    """(Multi)polygon features as one lon/lat coordinate buffer plus offsets:
+    ring_offsets into coords, part_offsets into rings, feature_offsets into
+    parts. Names are interned codes (code of "" = unnamed)."""
+
+    def __init__(self, coords, ring_offsets, part_offsets, feature_offsets, name_codes, names, features_json=None):
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+        self.part_offsets = np.asarray(part_offsets, dtype=np.int64)
+        self.feature_offsets = np.asarray(feature_offsets, dtype=np.int64)
+        self.name_codes = np.asarray(name_codes, dtype=np.int32)
+        self.names = np.asarray(names, dtype=str)
+        self._features = features_json
+
+    @classmethod
+    def from_geometries(cls, geoms, names):
+        if not len(geoms):
+            return cls(np.zeros((0, 2)), [0], [0], [0], [], [""])
+        # Promote Polygons to single-part MultiPolygons so to_ragged_array always
+        # returns the MultiPolygon layout (three offset arrays)
+        geoms = np.array(geoms, dtype=object)
+        single = shapely.get_type_id(geoms) == shapely.GeometryType.POLYGON
+        if single.any():
+            geoms[single] = shapely.multipolygons(geoms[single][:, None])
+        _, coords, (rings, parts, features) = shapely.to_ragged_array(geoms)
+        codes, table = intern(names)
+        return cls(coords, rings, parts, features, codes, table)
+
+    def __len__(self):
+        return len(self.feature_offsets) - 1
+
+    def geometries(self):
+        """Shapely MultiPolygon array, one per feature."""
+        if not len(self):
+            return np.array([], dtype=object)
+        return shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, self.coords,
+                                         (self.ring_offsets, self.part_offsets, self.feature_offsets))
+
+    def union(self):
+        return shapely.union_all(self.geometries())
+
+    def features_json(self):
+        """GeoJSON MultiPolygon features, encoded once from the buffers."""
+        if self._features is None:
+            xy = _coord_strings(self.coords)
+            ro, po, fo = self.ring_offsets.tolist(), self.part_offsets.tolist(), self.feature_offsets.tolist()
+            rings = ["[" + ",".join(xy[ro[i]:ro[i+1]]) + "]" for i in range(len(ro) - 1)]
+            polys = ["[" + ",".join(rings[po[i]:po[i+1]]) + "]" for i in range(len(po) - 1)]
+            names = self.names.tolist()
+            parts = []
+            for i, code in enumerate(self.name_codes.tolist()):
+                props = f'{{"name":{json.dumps(names[code], ensure_ascii=False)}}}' if names[code] else "{}"
+                parts.append(f'{{"type":"Feature","properties":{props},"geometry":{{"type":"MultiPolygon",'
+                             f'"coordinates":[{",".join(polys[fo[i]:fo[i+1]])}]}}}}')
+            self._features = RawJSON(("[" + ",".join(parts) + "]").encode("utf-8"))
+        return self._features
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}_coords": self.coords, f"{prefix}_ring_offsets": self.ring_offsets,
+                f"{prefix}_part_offsets": self.part_offsets, f"{prefix}_feature_offsets": self.feature_offsets,
+                f"{prefix}_name_codes": self.name_codes, f"{prefix}_names": self.names,
+                f"{prefix}_features_json": np.frombuffer(self.features_json().data, dtype=np.uint8)}
+
+    @classmethod
+    def from_arrays(cls, data, prefix):
+        return cls(data[f"{prefix}_coords"], data[f"{prefix}_ring_offsets"], data[f"{prefix}_part_offsets"],
+                   data[f"{prefix}_feature_offsets"], data[f"{prefix}_name_codes"], data[f"{prefix}_names"],
+                   RawJSON(data[f"{prefix}_features_json"].tobytes()))
+
+
+class GeoData:
+    def __init__(self, obstacles, rocks, ports):
+        self.obstacles, self.rocks, self.ports = obstacles, rocks, ports
+
+    def nbytes(self):
+        arrays = {**self.obstacles.to_arrays("o"), **self.rocks.to_arrays("r"), **self.ports.to_arrays("p")}
+        return sum(a.nbytes for a in arrays.values())
+
+    def save(self, path, key=""):
+        np.savez_compressed(path, key=np.array(key), **self.obstacles.to_arrays("obstacles"),
+                            **self.rocks.to_arrays("rocks"), **self.ports.to_arrays("ports"))
+
+    @classmethod
+    def load(cls, path, key=""):
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["key"]) != key:
+                return None
+            data = dict(data)
+        return cls(PolygonTable.from_arrays(data, "obstacles"), PointTable.from_arrays(data, "rocks"),
+                   PointTable.from_arrays(data, "ports"))
+
+
+# ---------- Ingestion ----------
+def _load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_polygons(paths):
+    """(geometries, names) of the polygonal features of GeoJSON FeatureCollections."""
+    geoms, names = [], []
+    for path in paths:
+        data = _load_json(path)
+        if data.get("type") != "FeatureCollection":
+            continue
+        for feat in data.get("features", []):
+            geom = feat.get("geometry")
+            if not geom:
+                continue
+            if geom.get("type") not in ("Polygon", "MultiPolygon"):
+                logging.warning("Skipping %s obstacle in %s", geom.get("type"), Path(path).name)
+                continue
+            geoms.append(shape(geom))
+            names.append((feat.get("properties") or {}).get("name") or "")
+    return geoms, names
+
+
+def read_points(path, default_name):
+    """{"lat", "lon", "name"} records from Overpass JSON nodes or GeoJSON Points."""
+    data = _load_json(path)
+    points = []
+    if not isinstance(data, dict):
+        return points
+    if "elements" in data:
+        for e in data["elements"]:
+            if e.get("type") == "node" and "lat" in e and "lon" in e:
+                points.append({"lat": e["lat"], "lon": e["lon"], "name": e.get("tags", {}).get("name", default_name)})
+    elif data.get("type") == "FeatureCollection":
+        for feat in data.get("features", []):
+            geom = feat.get("geometry") or {}
+            if geom.get("type") == "Point":
+                lon, lat = geom["coordinates"][:2]
+                points.append({"lat": lat, "lon": lon,
+                               "name": (feat.get("properties") or {}).get("name", default_name)})
+    return points
+
+
+def ingest(polygon_paths, rocks_path, ports_path):
+    geoms, names = read_polygons(polygon_paths)
+    return GeoData(PolygonTable.from_geometries(geoms, names),
+                   PointTable.from_records(read_points(rocks_path, "rock")),
+                   PointTable.from_records(read_points(ports_path, "port")))
+
+
+def geodata_cache_key(source_paths):
+    parts = [f"{p.name}:{os.path.getmtime(p):.0f}:{os.path.getsize(p)}"
+             for p in map(Path, source_paths) if p.exists()]
+    return "|".join(parts + [f"v{GEODATA_VERSION}:{COORD_DECIMALS}"])
+
+
+def load_or_ingest(cache_path, polygon_paths, rocks_path, ports_path):
+    cache_path = Path(cache_path)
+    key = geodata_cache_key([*polygon_paths, rocks_path, ports_path])
+    if cache_path.exists():
+        try:
+            data = GeoData.load(cache_path, key)
+            if data is not None:
+                return data
+        except Exception as e:
+            logging.warning("Ignoring unreadable geodata cache %s: %s", cache_path, e)
+
+    data = ingest(polygon_paths, rocks_path, ports_path)
+    os.makedirs(cache_path.parent, exist_ok=True)
+    data.save(cache_path, key)
+    logging.info("Ingested %d obstacles, %d rocks, %d ports -> %s",
+                 len(data.obstacles), len(data.rocks), len(data.ports), cache_path)
+    return data
+
+
+if __name__ == "__main__":
+    # Re-ingest and compare the memory held by the parsed sources with the tables.
+    import gc, time, tracemalloc
+
+    data_dir = Path(__file__).parent / "data"
+    polygon_paths = [data_dir / "islands.geojson", data_dir / "land.geojson"]
+    rocks_path, ports_path = data_dir / "rocks.geojson", data_dir / "ports.geojson"
+    cache_path = data_dir / "cache" / "geodata.npz"
+
+    def traced(fn):
+        gc.collect()
+        tracemalloc.start()
+        t = time.perf_counter()
+        value = fn()
+        dt = time.perf_counter() - t
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return value, size, dt
+
+    def parsed_sources():
+        # What the app used to keep: the parsed documents plus the feature / point lists.
+        docs = [_load_json(p) for p in [*polygon_paths, rocks_path, ports_path]]
+        return docs, read_points(rocks_path, "rock"), read_points(ports_path, "port")
+
+    _, raw_bytes, raw_s = traced(parsed_sources)
+    cache_path.unlink(missing_ok=True)
+    t = time.perf_counter()
+    load_or_ingest(cache_path, polygon_paths, rocks_path, ports_path)
+    ingest_s = time.perf_counter() - t
+    data, table_bytes, load_s = traced(lambda: load_or_ingest(cache_path, polygon_paths, rocks_path, ports_path))
+    print(f"parsed sources : {raw_bytes / 1e6:7.2f} MB of Python objects, {raw_s * 1000:7.1f} ms to load")
+    print(f"columnar tables: {table_bytes / 1e6:7.2f} MB ({data.nbytes() / 1e6:.2f} MB arrays incl. "
+          f"pre-encoded GeoJSON), {load_s * 1000:7.1f} ms to load from {cache_path.name}")
+    print(f"ingest         : {ingest_s * 1000:7.1f} ms; {len(data.obstacles)} obstacles "
+          f"({len(data.obstacles.coords)} vertices), {len(data.rocks)} rocks, {len(data.ports)} ports, "
+          f"{len(data.rocks.names) + len(data.ports.names) + len(data.obstacles.names)} distinct names")
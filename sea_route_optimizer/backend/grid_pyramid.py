@@ -0,0 +1,293 @@
+# backend/grid_pyramid.py
+# Multi-resolution obstacle masks and coarse-to-fine A*.
+#
+# The finest mask is rasterized once from the obstacle union; every coarser
+# level is a block reduction of it (a coarse cell is land only if all of its
+# fine cells are land), so narrow straits stay open at the coarse levels and
+# the refinement passes decide whether they are really navigable. Rocks are
+# stamped into the finest mask before the reduction, like land, and as whole
+# cells only at DEFAULT_RESOLUTION and finer: a rock must not close a strait
+# at the coarse level that the finer levels would find open.
+import os, heapq, logging
+from pathlib import Path
+import numpy as np
+import shapely
+
+from geo import haversine_nm, haversine_nm_np
+
+PYRAMID_RESOLUTIONS = (0.4, 0.2, 0.1, 0.05, 0.025)   # degrees, coarse -> fine
+DEFAULT_RESOLUTION = 0.2
+BLOCKED = 1e9
+SHIP_WEIGHT = 50.0
+ALT_PENALTY = 200.0
+BAND_CELLS = 3        # refinement corridor half-width, in cells of the finer level
+PYRAMID_VERSION = 2
+
+
+class GridLevel:
+    """One level of the pyramid: a boolean land/rock mask over SEA_BOUNDS."""
+
+    def __init__(self, res, mask, lat_min, lon_min):
+        self.res = res
+        self.mask = mask
+        self.lat_min = lat_min
+        self.lon_min = lon_min
+        self.rows, self.cols = mask.shape
+
+    def cell(self, lat, lon):
+        r = int((lat - self.lat_min) / self.res)
+        c = int((lon - self.lon_min) / self.res)
+        return max(0, min(self.rows-1, r)), max(0, min(self.cols-1, c))
+
+    def center(self, r, c):
+        return self.lat_min + (r + 0.5) * self.res, self.lon_min + (c + 0.5) * self.res
+
+    def window(self, lat_min, lat_max, lon_min, lon_max):
+        r0, c0 = self.cell(lat_min, lon_min)
+        r1, c1 = self.cell(lat_max, lon_max)
+        return r0, r1 + 1, c0, c1 + 1
+
+
+class GridPyramid:
+    def __init__(self, levels):
+        self.levels = sorted(levels, key=lambda lv: -lv.res)   # coarse -> fine
+
+    @property
+    def resolutions(self):
+        return [lv.res for lv in self.levels]
+
+    def level(self, resolution=None):
+        """Level whose resolution is closest to the requested one."""
+        resolution = resolution or DEFAULT_RESOLUTION
+        return min(self.levels, key=lambda lv: abs(lv.res - resolution))
+
+    def save(self, path, key=""):
+        arrays = {f"mask_{i}": lv.mask for i, lv in enumerate(self.levels)}
+        first = self.levels[0]
+        np.savez_compressed(path, resolutions=np.array(self.resolutions),
+                            origin=np.array([first.lat_min, first.lon_min]),
+                            key=np.array(key), **arrays)
+
+    @classmethod
+    def load(cls, path, key=""):
+        with np.load(path) as data:
+            if str(data["key"]) != key:
+                return None
+            lat_min, lon_min = data["origin"].tolist()
+            return cls([GridLevel(float(res), data[f"mask_{i}"], lat_min, lon_min)
+                        for i, res in enumerate(data["resolutions"])])
+
+
+# ---------- Build / cache ----------
+def build_pyramid(obstacles, rocks, bounds, resolutions=PYRAMID_RESOLUTIONS):
+    finest = min(resolutions)
+    rows = round((bounds["lat_max"] - bounds["lat_min"]) / finest)
+    cols = round((bounds["lon_max"] - bounds["lon_min"]) / finest)
+
+    lats = bounds["lat_min"] + (np.arange(rows) + 0.5) * finest
+    lons = bounds["lon_min"] + (np.arange(cols) + 0.5) * finest
+    lon_grid, lat_grid = np.meshgrid(lons, lats)
+    shapely.prepare(obstacles)
+    land = shapely.contains_xy(obstacles, lon_grid.ravel(), lat_grid.ravel()).reshape(rows, cols)
+    land[np.clip(((rocks.lat - bounds["lat_min"]) / finest).astype(int), 0, rows - 1),
+         np.clip(((rocks.lon - bounds["lon_min"]) / finest).astype(int), 0, cols - 1)] = True
+
+    levels = []
+    for res in resolutions:
+        k = round(res / finest)
+        if abs(k * finest - res) > 1e-9 or rows % k or cols % k:
+            raise ValueError(f"resolution {res} does not tile the finest level {finest}")
+        mask = land.reshape(rows // k, k, cols // k, k).all(axis=(1, 3)) if k > 1 else land.copy()
+        level = GridLevel(res, mask, bounds["lat_min"], bounds["lon_min"])
+        if res <= DEFAULT_RESOLUTION + 1e-9:
+            # Same rock cells as the single-resolution grid at the base level and below
+            r = np.clip(((rocks.lat - level.lat_min) / res).astype(int), 0, level.rows - 1)
+            c = np.clip(((rocks.lon - level.lon_min) / res).astype(int), 0, level.cols - 1)
+            mask[r, c] = True
+        levels.append(level)
+    return GridPyramid(levels)
+
+
+def pyramid_cache_key(source_paths, bounds, resolutions=PYRAMID_RESOLUTIONS):
+    parts = [f"{p.name}:{os.path.getmtime(p):.0f}:{os.path.getsize(p)}"
+             for p in map(Path, source_paths) if p.exists()]
+    parts.append(",".join(f"{bounds[k]}" for k in ("lat_min", "lat_max", "lon_min", "lon_max")))
+    parts.append(",".join(str(r) for r in resolutions))
+    parts.append(f"v{PYRAMID_VERSION}")
+    return "|".join(parts)
+
+
+def load_or_build_pyramid(cache_path, source_paths, obstacles, rocks, bounds, resolutions=PYRAMID_RESOLUTIONS):
+    cache_path = Path(cache_path)
+    key = pyramid_cache_key(source_paths, bounds, resolutions)
+    if cache_path.exists():
+        try:
+            pyramid = GridPyramid.load(cache_path, key)
+            if pyramid is not None:
+                return pyramid
+        except Exception as e:
+            logging.warning("Ignoring unreadable grid pyramid cache %s: %s", cache_path, e)
+
+    pyramid = build_pyramid(obstacles, rocks, bounds, resolutions)
+    os.makedirs(cache_path.parent, exist_ok=True)
+    pyramid.save(cache_path, key)
+    logging.info("Built grid pyramid %s -> %s", pyramid.resolutions, cache_path)
+    return pyramid
+
+
+# ---------- Search ----------
+def window_costs(level, window, ships=None):
+    r0, r1, c0, c1 = window
+    cost = np.where(level.mask[r0:r1, c0:c1], BLOCKED, 1.0)
+    for s in ships or []:
+        r, c = level.cell(s["lat"], s["lon"])
+        if r0 <= r < r1 and c0 <= c < c1:
+            cost[r-r0, c-c0] = max(cost[r-r0, c-c0], SHIP_WEIGHT)
+    return cost
+
+
+def dilate(mask, radius):
+    out = mask.copy()
+    for _ in range(radius):
+        grown = out.copy()
+        grown[1:, :] |= out[:-1, :]
+        grown[:-1, :] |= out[1:, :]
+        grown[:, 1:] |= out[:, :-1]
+        grown[:, :-1] |= out[:, 1:]
+        out = grown
+    return out
+
+
+def corridor(coarse_level, coarse_path, level, window, radius):
+    """Footprint of a coarser path on `level`'s window, grown by `radius` cells."""
+    r0, r1, c0, c1 = window
+    k = round(coarse_level.res / level.res)
+    band = np.zeros((r1-r0, c1-c0), dtype=bool)
+    for R, C in coarse_path:
+        band[max(R*k - r0, 0):max(R*k + k - r0, 0), max(C*k - c0, 0):max(C*k + k - c0, 0)] = True
+    return dilate(band, radius)
+
+
+def astar_cells(level, cost, window, start, goal, allowed=None, stats=None):
+    """4-neighbour A* inside `window` of one level.
+
+    `start`/`goal` and the returned path are absolute (row, col) cells of the
+    level. Step cost is the centre-to-centre distance times the weight of the
+    cell entered, as in `weighted_a_star_sub`.
+    """
+    r0, r1, c0, c1 = window
+    Rn, Cn = r1 - r0, c1 - c0
+    if not (r0 <= start[0] < r1 and c0 <= start[1] < c1 and r0 <= goal[0] < r1 and c0 <= goal[1] < c1):
+        return None
+    s = (start[0]-r0) * Cn + (start[1]-c0)
+    e = (goal[0]-r0) * Cn + (goal[1]-c0)
+
+    cost = cost.copy()
+    if allowed is not None:
+        cost[~allowed] = BLOCKED
+    cost = cost.ravel().tolist()
+    if cost[s] >= BLOCKED: cost[s] = 1.0
+    if cost[e] >= BLOCKED: cost[e] = 1.0
+
+    lats = level.lat_min + (np.arange(r0, r1) + 0.5) * level.res
+    lons = (level.lon_min + (np.arange(c0, c1) + 0.5) * level.res).tolist()
+    ew = haversine_nm_np(lats, 0.0, lats, level.res).tolist()   # east-west step per row
+    ns = haversine_nm(0.0, 0.0, level.res, 0.0)                 # north-south step
+    lats = lats.tolist()
+    g_lat, g_lon = lats[goal[0]-r0], lons[goal[1]-c0]
+
+    def heuristic(idx):
+        r, c = divmod(idx, Cn)
+        return haversine_nm(lats[r], lons[c], g_lat, g_lon)
+
+    inf = float("inf")
+    g_score = {s: 0.0}
+    came_from = {}
+    open_set = [(heuristic(s), 0.0, s)]
+    expanded = pushes = 0
+    path = None
+    while open_set:
+        _, g_cur, cur = heapq.heappop(open_set)
+        if g_cur > g_score.get(cur, inf):
+            continue
+        expanded += 1
+        if cur == e:
+            path = [cur]
+            while cur in came_from:
+                cur = came_from[cur]
+                path.append(cur)
+            path.reverse()
+            break
+        r, c = divmod(cur, Cn)
+        nbrs = []
+        if r > 0: nbrs.append((cur - Cn, ns))
+        if r < Rn-1: nbrs.append((cur + Cn, ns))
+        if c > 0: nbrs.append((cur - 1, ew[r]))
+        if c < Cn-1: nbrs.append((cur + 1, ew[r]))
+        for nxt, step in nbrs:
+            w = cost[nxt]
+            if w >= BLOCKED:
+                continue
+            tentative_g = g_cur + step * w
+            if tentative_g < g_score.get(nxt, inf):
+                g_score[nxt] = tentative_g
+                came_from[nxt] = cur
+                heapq.heappush(open_set, (tentative_g + heuristic(nxt), tentative_g, nxt))
+                pushes += 1
+
+    if stats is not None:
+        stats["nodes_expanded"] = stats.get("nodes_expanded", 0) + expanded
+        stats["heap_pushes"] = stats.get("heap_pushes", 0) + pushes
+    if path is None:
+        return None
+    return [(idx // Cn + r0, idx % Cn + c0) for idx in path]
+
+
+def coarse_to_fine(pyramid, start_latlon, end_latlon, bbox, resolution=None, ships=None, stats=None):
+    """Search the coarsest level over the whole window, then each finer level
+    down to `resolution` only inside a corridor around the previous path.
+
+    Returns (cells, level); cells is None when no route exists.
+    """
+    target = pyramid.level(resolution)
+    prev_path = prev_level = None
+    for level in [lv for lv in pyramid.levels if lv.res >= target.res]:
+        window = level.window(**bbox)
+        cost = window_costs(level, window, ships)
+        if stats is not None:
+            stats["cells_rasterized"] = stats.get("cells_rasterized", 0) + cost.size
+        start, goal = level.cell(*start_latlon), level.cell(*end_latlon)
+        path = None
+        if prev_path is None:
+            path = astar_cells(level, cost, window, start, goal, stats=stats)
+        else:
+            for radius in (BAND_CELLS, BAND_CELLS * 4):
+                band = corridor(prev_level, prev_path, level, window, radius)
+                path = astar_cells(level, cost, window, start, goal, allowed=band, stats=stats)
+                if path:
+                    break
+            if path is None:   # corridor too tight: fall back to the whole window
+                path = astar_cells(level, cost, window, start, goal, stats=stats)
+        if path is None:
+            return None, target
+        prev_path, prev_level = path, level
+    return prev_path, target
+
+
+def alternative_cells(level, start_latlon, end_latlon, bbox, main_path, ships=None, stats=None):
+    """Alternative route: penalize the middle third of `main_path` and search a
+    wider corridor around it on the same level."""
+    window = level.window(**bbox)
+    r0, _, c0, _ = window
+    cost = window_costs(level, window, ships)
+    if stats is not None:
+        stats["cells_rasterized"] = stats.get("cells_rasterized", 0) + cost.size
+    for r, c in main_path[len(main_path)//3:2*len(main_path)//3]:
+        cost[r-r0, c-c0] = max(cost[r-r0, c-c0], ALT_PENALTY)
+    band = corridor(level, main_path, level, window, BAND_CELLS * 4)
+    return astar_cells(level, cost, window, level.cell(*start_latlon), level.cell(*end_latlon),
+                       allowed=band, stats=stats)
+
+
+def cells_to_latlon(level, cells):
+    return [level.center(r, c) for r, c in cells]
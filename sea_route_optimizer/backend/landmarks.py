@@ -0,0 +1,251 @@
+# backend/landmarks.py
+# ALT (A*, landmarks, triangle inequality) lower bounds for the uniform grid
+# search in app1, and a bidirectional A* that uses them.
+#
+# Sea distances from LANDMARK_COUNT landmark cells to every cell of the full
+# GRID_RES grid are computed once with Dijkstra on the unweighted sea grid
+# (land and rocks blocked as in build_weight_grid, every port cell open) and
+# stored as a float32 (landmarks, rows, cols) .npy that is memory-mapped at
+# startup. For a target t, |d(L, t) - d(L, v)| is a lower bound of the sea
+# distance v -> t; request grids only add costs (ship weights, the alternative
+# penalty, the search window, extra rocks), so the bound stays admissible and
+# consistent for them. Unlike the haversine bound it sees coastlines: cells
+# behind a peninsula get a large bound and are not expanded.
+#
+# Blocked cells hold NaN in the table, sea cells that a landmark cannot reach
+# hold inf. Endpoints that are blocked in the table (not a port, on land) have
+# no valid bound; callers fall back to the haversine heuristic for them.
+import heapq, json, logging, os, time
+from pathlib import Path
+import numpy as np
+import shapely
+
+from geo import haversine_nm, haversine_nm_np
+
+LANDMARK_COUNT = 16
+ALT_SLACK_NM = 1e-3      # float32 rounding of the tables; keeps the bounds admissible
+BLOCKED = 1e9
+
+
+class SeaGrid:
+    """Cell geometry of the uniform routing grid and its step costs (nm)."""
+
+    def __init__(self, bounds, res, rows, cols):
+        self.bounds, self.res, self.rows, self.cols = bounds, res, rows, cols
+        self.lat = bounds["lat_min"] + np.arange(rows) * res + res / 2.0
+        self.lon = bounds["lon_min"] + np.arange(cols) * res + res / 2.0
+        lat, lon0, lon1 = self.lat.tolist(), float(self.lon[0]), float(self.lon[min(1, cols - 1)])
+        # step_ns[r]: between rows r and r+1; step_ew[r]: between neighbouring cells of row r
+        self.step_ns = [haversine_nm(lat[r], lon0, lat[r + 1], lon0) for r in range(rows - 1)] + [0.0]
+        self.step_ew = [haversine_nm(lat[r], lon0, lat[r], lon1) for r in range(rows)]
+
+    def cells(self, lat, lon):
+        """Vectorized latlon_to_grid."""
+        r = np.clip(((np.asarray(lat) - self.bounds["lat_min"]) / self.res).astype(int), 0, self.rows - 1)
+        c = np.clip(((np.asarray(lon) - self.bounds["lon_min"]) / self.res).astype(int), 0, self.cols - 1)
+        return r, c
+
+    def sea_mask(self, obstacles, rocks, ports):
+        """Passable cells as build_weight_grid sees them, with every port cell open."""
+        lon_grid, lat_grid = np.meshgrid(self.lon, self.lat)
+        shapely.prepare(obstacles)
+        passable = ~shapely.contains_xy(obstacles, lon_grid, lat_grid)
+        passable[self.cells(rocks.lat, rocks.lon)] = False
+        passable[self.cells(ports.lat, ports.lon)] = True
+        return passable
+
+
+def sea_dijkstra(passable, grid, source):
+    """Sea distance (nm) from cell `source` to every cell; inf where unreachable."""
+    rows, cols = passable.shape
+    open_ = passable.ravel().tolist()
+    step_ns, step_ew = grid.step_ns, grid.step_ew
+    dist = [float("inf")] * (rows * cols)
+    src = source[0] * cols + source[1]
+    dist[src] = 0.0
+    heap = [(0.0, src)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        r, c = divmod(u, cols)
+        neighbours = []
+        if r > 0:
+            neighbours.append((u - cols, step_ns[r - 1]))
+        if r < rows - 1:
+            neighbours.append((u + cols, step_ns[r]))
+        if c > 0:
+            neighbours.append((u - 1, step_ew[r]))
+        if c < cols - 1:
+            neighbours.append((u + 1, step_ew[r]))
+        for v, step in neighbours:
+            if not open_[v]:
+                continue
+            nd = d + step
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return np.array(dist).reshape(rows, cols)
+
+
+def build_landmarks(passable, grid, count=LANDMARK_COUNT):
+    """Farthest-point landmarks: each new landmark is the sea cell farthest
+    (by sea distance) from the ones already chosen. Returns (table, cells)."""
+    rows, cols = passable.shape
+    rr, cc = np.indices(passable.shape)
+    seed = np.unravel_index(np.argmin(np.where(passable, np.hypot(rr - rows / 2, cc - cols / 2), np.inf)),
+                            passable.shape)
+    nearest = sea_dijkstra(passable, grid, seed)     # to the closest landmark so far (the seed at first)
+    tables, cells = [], []
+    for i in range(count):
+        reach = np.where(np.isfinite(nearest), nearest, -1.0)
+        cell = np.unravel_index(np.argmax(reach), reach.shape)
+        dist = sea_dijkstra(passable, grid, cell)
+        tables.append(np.where(passable, dist, np.nan).astype(np.float32))
+        cells.append([int(cell[0]), int(cell[1])])
+        nearest = dist if i == 0 else np.minimum(nearest, dist)
+    return np.stack(tables), cells
+
+
+class LandmarkTable:
+    def __init__(self, dist, grid, cells=()):
+        self.dist = dist           # (landmarks, rows, cols) float32, usually a read-only memmap
+        self.grid = grid
+        self.cells = list(cells)
+
+    def covers(self, cell):
+        """True when the table has bounds for this (global) endpoint cell."""
+        return not np.isnan(self.dist[0, cell[0], cell[1]])
+
+    def connected(self, a, b):
+        """False when the sea graph certainly has no path a -> b (different components)."""
+        if not (self.covers(a) and self.covers(b)):
+            return True
+        da, db = self.dist[:, a[0], a[1]], self.dist[:, b[0], b[1]]
+        return not np.any(np.isfinite(da) != np.isfinite(db))
+
+    def bounds_to(self, target, r0, c0, rows, cols, alt=True):
+        """Lower bounds (nm) of the sea distance from every cell of the window
+        [r0, r0+rows) x [c0, c0+cols) to the global cell `target`: the larger
+        of the landmark bound and the haversine distance; inf for cells that
+        cannot reach the target."""
+        tr, tc = target
+        g = self.grid
+        hav = haversine_nm_np(g.lat[r0:r0 + rows, None], g.lon[None, c0:c0 + cols], g.lat[tr], g.lon[tc])
+        if not alt or not self.covers(target):
+            return hav
+        dt = np.asarray(self.dist[:, tr, tc], dtype=np.float64)
+        use = np.flatnonzero(np.isfinite(dt))
+        if not len(use):
+            return hav
+        win = np.asarray(self.dist[use, r0:r0 + rows, c0:c0 + cols], dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            bound = np.abs(win - dt[use, None, None]).max(axis=0) - ALT_SLACK_NM
+        return np.fmax(bound, hav)   # NaN (blocked) cells keep the haversine bound
+
+    def save(self, path, meta_path, key=""):
+        np.save(path, self.dist)
+        Path(meta_path).write_text(json.dumps({"key": key, "cells": self.cells}), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path, meta_path, grid, key=""):
+        meta = json.loads(Path(meta_path).read_text(encoding="utf-8"))
+        if meta.get("key") != key:
+            return None
+        dist = np.load(path, mmap_mode="r")
+        if dist.shape[1:] != (grid.rows, grid.cols):
+            return None
+        return cls(dist, grid, meta.get("cells", []))
+
+
+def load_or_build_landmarks(cache_path, grid, obstacles, rocks, ports, key="", count=LANDMARK_COUNT):
+    cache_path = Path(cache_path)
+    meta_path = cache_path.with_suffix(".json")
+    key = f"{key}|{grid.res}|{grid.rows}x{grid.cols}|{count}"
+    if cache_path.exists() and meta_path.exists():
+        try:
+            table = LandmarkTable.load(cache_path, meta_path, grid, key)
+            if table is not None:
+                return table
+        except Exception as e:
+            logging.warning("Ignoring unreadable landmark cache %s: %s", cache_path, e)
+
+    t = time.perf_counter()
+    dist, cells = build_landmarks(grid.sea_mask(obstacles, rocks, ports), grid, count)
+    os.makedirs(cache_path.parent, exist_ok=True)
+    LandmarkTable(dist, grid, cells).save(cache_path, meta_path, key)
+    logging.info("Built %d landmark tables (%.1f MB) in %.1fs -> %s", count, dist.nbytes / 1e6,
+                 time.perf_counter() - t, cache_path)
+    return LandmarkTable.load(cache_path, meta_path, grid, key)
+
+
+# ---------- Bidirectional search ----------
+def bidirectional_search(grid, s, e, rmin, Rn, Cn, h_to_e, h_to_s, sea_grid, stats=None):
+    """Bidirectional A* over a window of the weighted grid (grid[r][c] is the
+    cost factor of entering a cell, >= BLOCKED is impassable). Both searches
+    use the average potential p(v) = (h_to_e(v) - h_to_s(v)) / 2 (and -p
+    backwards), which keeps reduced costs non-negative in both directions, so
+    the search can stop as soon as the two frontier minima add up to the best
+    meeting cost. Returns the path as window cells, or None."""
+    if s == e:
+        return [s]
+    step_ns, step_ew = sea_grid.step_ns, sea_grid.step_ew
+    inf = float("inf")
+
+    def potential(v):
+        he, hs = h_to_e[v[0]][v[1]], h_to_s[v[0]][v[1]]
+        return inf if he == inf or hs == inf else (he - hs) / 2.0
+
+    g = ({s: 0.0}, {e: 0.0})               # forward, backward
+    parent = ({}, {})
+    closed = (set(), set())
+    heaps = ([(potential(s), s)], [(-potential(e), e)])
+    best, meet = inf, None
+    expanded = pushes = 0
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+        _, u = heapq.heappop(heaps[side])
+        if u in closed[side]:
+            continue
+        closed[side].add(u)
+        expanded += 1
+        gu = g[side][u]
+        r, c = u
+        w_u = grid[r][c]
+        for v in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+            vr, vc = v
+            if not (0 <= vr < Rn and 0 <= vc < Cn) or v in closed[side]:
+                continue
+            w_v = grid[vr][vc]
+            if w_v >= BLOCKED:
+                continue
+            step = step_ew[r + rmin] if vr == r else step_ns[min(r, vr) + rmin]
+            # forward enters v; backward walks the edge v -> u, which enters u
+            ng = gu + step * (w_v if side == 0 else w_u)
+            if ng < g[side].get(v, inf):
+                p = potential(v)
+                if p == inf or p == -inf:
+                    continue
+                g[side][v] = ng
+                parent[side][v] = u
+                heapq.heappush(heaps[side], (ng + (p if side == 0 else -p), v))
+                pushes += 1
+                other = g[1 - side].get(v)
+                if other is not None and ng + other < best:
+                    best, meet = ng + other, v
+
+    if stats is not None:
+        stats["nodes_expanded"] = stats.get("nodes_expanded", 0) + expanded
+        stats["heap_pushes"] = stats.get("heap_pushes", 0) + pushes
+    if meet is None:
+        return None
+    path = [meet]
+    while path[-1] in parent[0]:
+        path.append(parent[0][path[-1]])
+    path.reverse()
+    while path[-1] in parent[1]:
+        path.append(parent[1][path[-1]])
+    return path
@@ -9,6 +9,8 @@ from typing import Optional, Dict
 import requests
 import datetime
 
+from compliance import ComplianceEngine
+
 app = FastAPI(title="RouteUrSea - Emissions & Sustainability Module")
 
 # Mount static directory
@@ -124,57 +126,18 @@ def get_badge(improvement_pct):
 #======================================================
 #                Check Compliance
 #======================================================
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+COMPLIANCE = ComplianceEngine.from_files(os.path.join(DATA_DIR, "compliance_rules.json"),
+                                         os.path.join(DATA_DIR, "geofences.geojson"))
+
 def check_marpol_limits(vessel_type: str, fuel_type: str, co2_kg: float, speed_knots: float):
     """
-    MARPOL compliance checks.
+    MARPOL compliance checks, driven by data/compliance_rules.json.
     Returns a dict with each annex:
     - message: explanatory string
     - passed: True/False
     """
-    compliance = {}
-
-    # Annex VI – Air Pollution (emissions)
-    if (vessel_type == "small_coastal" and co2_kg > 2500) or \
-       (vessel_type == "medium_cargo" and co2_kg > 6000) or \
-       (vessel_type == "large_container" and co2_kg > 20000):
-        compliance["annex_vi_Air_Pollution"] = {
-            "message": "❌ Exceeds emission threshold (Annex VI)",
-            "passed": False
-        }
-    else:
-        compliance["annex_vi_Air_Pollution"] = {
-            "message": "✅ Within emission limits (Annex VI)",
-            "passed": True
-        }
-
-
-    # Annex I – Oil pollution (simplified)
-    if vessel_type == "small_coastal" and fuel_type == "HFO":
-        compliance["annex_i"] = {
-            "message": "⚠️ HFO restricted for small coastal vessels (Annex I)",
-            "passed": False
-        }
-    else:
-        compliance["annex_i"] = {
-            "message": "✅ Fuel use compliant (Annex I)",
-            "passed": True
-        }
-
-    # Annex VI – Speed optimization check (eco-speed)
-    if (vessel_type == "small_coastal" and speed_knots > 9) or \
-       (vessel_type == "medium_cargo" and speed_knots > 12) or \
-       (vessel_type == "large_container" and speed_knots > 18):
-        compliance["annex_vi_eco_speed"] = {
-            "message": "⚠️ Above eco-speed, may increase emissions (Annex VI)",
-            "passed": False
-        }
-    else:
-        compliance["annex_vi_eco_speed"] = {
-            "message": "✅ Speed within eco-recommendations (Annex VI)",
-            "passed": True
-        }
-
-    return compliance
+    return COMPLIANCE.check(vessel_type, fuel_type, co2_kg, speed_knots)
 
 
 
@@ -228,4 +191,4 @@ def calculate(req: CalcRequest):
         "scenarios": scenarios
     }
 
-    return result
\ No newline at end of file
+    return result
@@ -0,0 +1,177 @@
+# backend/metrics.py
+# Per-request stage timings and search counters, exported as Prometheus
+# histograms (/metrics) and as a Server-Timing header.
+#
+# A RequestMetrics object lives in a context variable for the duration of one
+# request; code anywhere below the handler records into it with
+# `with stage("search"):` and `count("nodes_expanded", n)`. Outside a request
+# both are no-ops apart from a perf_counter call, so they can stay in hot code.
+import bisect, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+BYTES_BUCKETS = (1024, 16384, 131072, 1048576, 4194304, 16777216)
+
+# Counter name -> histogram buckets; counters not listed here are only summed.
+COUNTERS = {
+    "nodes_expanded": COUNT_BUCKETS,
+    "heap_pushes": COUNT_BUCKETS,
+    "cells_rasterized": COUNT_BUCKETS,
+    "payload_bytes": BYTES_BUCKETS,
+}
+METRIC_PREFIX = "routeursea"
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}      # stage -> seconds, in first-seen order
+        self.counters = {}    # name -> int
+        self.profile_requested = False
+        self.profile = None   # StackSampler of a profiled handler (see profiling.py)
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def server_timing(self, total=None):
+        parts = [f"{name};dur={sec*1000:.2f}" for name, sec in self.stages.items()]
+        if total is not None:
+            parts.append(f"total;dur={total*1000:.2f}")
+        return ", ".join(parts)
+
+
+_current = ContextVar("request_metrics", default=None)
+
+
+def begin_request():
+    m = RequestMetrics()
+    return m, _current.set(m)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def search_stats():
+    """Counter dict of the current request, for the `stats=` argument of the
+    search functions; a throwaway dict outside a request."""
+    m = _current.get()
+    return m.counters if m is not None else {}
+
+
+@contextmanager
+def stage(name):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        m = _current.get()
+        if m is not None:
+            m.add_stage(name, time.perf_counter() - t)
+
+
+def count(name, n=1):
+    m = _current.get()
+    if m is not None:
+        m.add(name, n)
+
+
+# ---------- Prometheus exposition ----------
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, label_names=()):
+        self.name, self.help, self.buckets, self.label_names = name, help_text, tuple(buckets), tuple(label_names)
+        self._series = {}     # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for values, s in sorted(series.items()):
+            base = list(zip(self.label_names, values))
+            cumulative = 0
+            for bound, n in zip(self.buckets, s):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(base + [('le', repr(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(base + [('le', '+Inf')])} {s[-1]}")
+            lines.append(f"{self.name}_sum{_labels(base)} {s[-2]}")
+            lines.append(f"{self.name}_count{_labels(base)} {s[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, n, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + n
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, v in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(list(zip(self.label_names, label_values)))} {v}")
+        return lines
+
+
+class MetricsRegistry:
+    """Aggregates finished RequestMetrics per route."""
+
+    def __init__(self, prefix=METRIC_PREFIX):
+        p = prefix
+        self.requests = Counter(f"{p}_requests_total", "Requests by route and status.", ("route", "status"))
+        self.duration = Histogram(f"{p}_request_duration_seconds", "Request duration.", STAGE_BUCKETS, ("route",))
+        self.stages = Histogram(f"{p}_stage_duration_seconds", "Time per request stage.", STAGE_BUCKETS,
+                                ("route", "stage"))
+        self.counters = {name: Histogram(f"{p}_{name}", f"{name.replace('_', ' ').capitalize()} per request.",
+                                         buckets, ("route",))
+                         for name, buckets in COUNTERS.items()}
+        self.totals = Counter(f"{p}_events_total", "Other per-request counters (cache hits / misses, ...).",
+                              ("route", "event"))
+
+    def record(self, route, status, m, total):
+        self.requests.inc(1, route, str(status))
+        self.duration.observe(total, route)
+        for name, sec in m.stages.items():
+            self.stages.observe(sec, route, name)
+        for name, n in m.counters.items():
+            if name in self.counters:
+                self.counters[name].observe(n, route)
+            else:
+                self.totals.inc(n, route, name)
+
+    def expose(self):
+        lines = []
+        for metric in [self.requests, self.duration, self.stages, *self.counters.values(), self.totals]:
+            lines += metric.expose()
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,278 @@
+# backend/navmesh.py
+# Quadtree navigation mesh: large cells in open sea, small cells near coasts
+# and rocks, with precomputed adjacency stored as CSR arrays.
+#
+# Built from the finest pyramid mask. Paths go leaf centre -> shared-edge
+# midpoint ("portal") -> leaf centre, so every segment stays inside sea leaves.
+import os, heapq, logging
+from pathlib import Path
+import numpy as np
+
+from geo import haversine_nm, haversine_nm_np
+
+MAX_LEAF_CELLS = 64      # largest leaf edge, in cells of the source level
+SHIP_WEIGHT = 50.0
+ALT_PENALTY = 200.0
+
+
+class NavMesh:
+    def __init__(self, res, lat_min, lon_min, r0, c0, size, indptr, indices, portal_r, portal_c):
+        self.res = res
+        self.lat_min = lat_min
+        self.lon_min = lon_min
+        self.r0, self.c0, self.size = r0, c0, size
+        self.indptr, self.indices = indptr, indices
+        self.portal_r, self.portal_c = portal_r, portal_c     # portal position per CSR edge, in cells
+        self.lat = lat_min + (r0 + size / 2.0) * res
+        self.lon = lon_min + (c0 + size / 2.0) * res
+        self.portal_lat = lat_min + portal_r * res
+        self.portal_lon = lon_min + portal_c * res
+        # Edge length = centre -> portal -> centre
+        src = np.repeat(np.arange(len(r0)), np.diff(indptr))
+        self.edge_nm = (haversine_nm_np(self.lat[src], self.lon[src], self.portal_lat, self.portal_lon)
+                        + haversine_nm_np(self.portal_lat, self.portal_lon, self.lat[indices], self.lon[indices]))
+
+    @property
+    def node_count(self):
+        return len(self.r0)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def locate(self, lat, lon):
+        """Index of the sea leaf containing (lat, lon), or the nearest one."""
+        r = (lat - self.lat_min) / self.res
+        c = (lon - self.lon_min) / self.res
+        inside = (self.r0 <= r) & (r < self.r0 + self.size) & (self.c0 <= c) & (c < self.c0 + self.size)
+        hits = np.flatnonzero(inside)
+        if len(hits):
+            return int(hits[0])
+        return int(np.argmin((self.lat - lat)**2 + (self.lon - lon)**2))
+
+    def leaves_in(self, lat_min, lat_max, lon_min, lon_max):
+        lat_top = self.lat_min + (self.r0 + self.size) * self.res
+        lon_right = self.lon_min + (self.c0 + self.size) * self.res
+        return ((lat_top > lat_min) & (self.lat_min + self.r0 * self.res < lat_max)
+                & (lon_right > lon_min) & (self.lon_min + self.c0 * self.res < lon_max))
+
+    def save(self, path, key=""):
+        np.savez_compressed(path, res=self.res, origin=np.array([self.lat_min, self.lon_min]),
+                            r0=self.r0, c0=self.c0, size=self.size, indptr=self.indptr, indices=self.indices,
+                            portal_r=self.portal_r, portal_c=self.portal_c, key=np.array(key))
+
+    @classmethod
+    def load(cls, path, key=""):
+        with np.load(path) as d:
+            if str(d["key"]) != key:
+                return None
+            lat_min, lon_min = d["origin"].tolist()
+            return cls(float(d["res"]), lat_min, lon_min, d["r0"], d["c0"], d["size"],
+                       d["indptr"], d["indices"], d["portal_r"], d["portal_c"])
+
+
+# ---------- Build ----------
+def build_navmesh(level, max_leaf=MAX_LEAF_CELLS):
+    """Decompose a pyramid level's mask into sea leaves and their adjacency."""
+    rows, cols = level.mask.shape
+    R = -(-rows // max_leaf) * max_leaf
+    C = -(-cols // max_leaf) * max_leaf
+    blocked = np.ones((R, C), dtype=bool)          # padding outside the bounds counts as blocked
+    blocked[:rows, :cols] = level.mask
+    integral = np.zeros((R+1, C+1), dtype=np.int64)
+    integral[1:, 1:] = blocked.cumsum(0).cumsum(1)
+
+    rr, cc = np.meshgrid(np.arange(0, R, max_leaf), np.arange(0, C, max_leaf), indexing="ij")
+    rr, cc = rr.ravel(), cc.ravel()
+    size = max_leaf
+    leaves_r, leaves_c, leaves_s = [], [], []
+    while len(rr):
+        n = integral[rr+size, cc+size] - integral[rr, cc+size] - integral[rr+size, cc] + integral[rr, cc]
+        sea = n == 0
+        leaves_r.append(rr[sea]); leaves_c.append(cc[sea]); leaves_s.append(np.full(sea.sum(), size))
+        mixed = (n > 0) & (n < size*size)
+        if size == 1:
+            break
+        half = size // 2
+        rr = np.concatenate([rr[mixed], rr[mixed], rr[mixed]+half, rr[mixed]+half])
+        cc = np.concatenate([cc[mixed], cc[mixed]+half, cc[mixed], cc[mixed]+half])
+        size = half
+    r0 = np.concatenate(leaves_r).astype(np.int32)
+    c0 = np.concatenate(leaves_c).astype(np.int32)
+    sz = np.concatenate(leaves_s).astype(np.int32)
+
+    # Leaf-id raster, used only to discover shared edges.
+    ids = np.full((R, C), -1, dtype=np.int32)
+    for i, (r, c, s) in enumerate(zip(r0.tolist(), c0.tolist(), sz.tolist())):
+        ids[r:r+s, c:c+s] = i
+
+    src, dst, pr, pc = [], [], [], []
+    # East-west neighbours share a vertical edge at column c+1, north-south at row r+1.
+    for a, b, r_off, c_off in ((ids[:, :-1], ids[:, 1:], 0.5, 1.0), (ids[:-1, :], ids[1:, :], 1.0, 0.5)):
+        rows_i, cols_i = np.nonzero((a >= 0) & (b >= 0) & (a != b))
+        pairs = np.stack([a[rows_i, cols_i], b[rows_i, cols_i]], axis=1)
+        uniq, inv = np.unique(pairs, axis=0, return_inverse=True)
+        inv = inv.ravel()
+        counts = np.bincount(inv)
+        mid_r = np.bincount(inv, weights=rows_i + r_off) / counts
+        mid_c = np.bincount(inv, weights=cols_i + c_off) / counts
+        for u, v in ((0, 1), (1, 0)):          # store both directions
+            src.append(uniq[:, u]); dst.append(uniq[:, v]); pr.append(mid_r); pc.append(mid_c)
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    pr, pc = np.concatenate(pr), np.concatenate(pc)
+
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(len(r0)+1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(r0)), out=indptr[1:])
+    return NavMesh(level.res, level.lat_min, level.lon_min, r0, c0, sz,
+                   indptr, dst[order].astype(np.int32), pr[order], pc[order])
+
+
+def load_or_build_navmesh(cache_path, level, key="", max_leaf=MAX_LEAF_CELLS):
+    cache_path = Path(cache_path)
+    key = f"{key}|{level.res}|{max_leaf}"
+    if cache_path.exists():
+        try:
+            mesh = NavMesh.load(cache_path, key)
+            if mesh is not None:
+                return mesh
+        except Exception as e:
+            logging.warning("Ignoring unreadable navmesh cache %s: %s", cache_path, e)
+
+    mesh = build_navmesh(level, max_leaf)
+    os.makedirs(cache_path.parent, exist_ok=True)
+    mesh.save(cache_path, key)
+    logging.info("Built navmesh: %d leaves, %d edges -> %s", mesh.node_count, mesh.edge_count, cache_path)
+    return mesh
+
+
+# ---------- Search ----------
+def leaf_weights(mesh, allowed, ships=None, penalized=None):
+    weights = np.where(allowed, 1.0, np.inf)
+    for s in ships or []:
+        i = mesh.locate(s["lat"], s["lon"])
+        weights[i] = max(weights[i], SHIP_WEIGHT)
+    for i in penalized or []:
+        weights[i] = max(weights[i], ALT_PENALTY)
+    return weights
+
+
+def astar_leaves(mesh, start, goal, weights, stats=None):
+    """A* over leaf indices. Entering a leaf costs edge length x its weight."""
+    indptr, indices, edge_nm = mesh.indptr, mesh.indices, mesh.edge_nm
+    lat, lon = mesh.lat.tolist(), mesh.lon.tolist()
+    g_lat, g_lon = lat[goal], lon[goal]
+    weights = weights.tolist()
+    weights[start] = weights[goal] = 1.0
+
+    inf = float("inf")
+    g_score = {start: 0.0}
+    came_from = {}
+    open_set = [(0.0, 0.0, start)]
+    expanded = pushes = 0
+    path = None
+    while open_set:
+        _, g_cur, cur = heapq.heappop(open_set)
+        if g_cur > g_score.get(cur, inf):
+            continue
+        expanded += 1
+        if cur == goal:
+            path = [cur]
+            while cur in came_from:
+                cur = came_from[cur][0]
+                path.append(cur)
+            path.reverse()
+            break
+        lo, hi = indptr[cur], indptr[cur+1]
+        for e, nxt, step in zip(range(lo, hi), indices[lo:hi].tolist(), edge_nm[lo:hi].tolist()):
+            w = weights[nxt]
+            if w == inf:
+                continue
+            tentative_g = g_cur + step * w
+            if tentative_g < g_score.get(nxt, inf):
+                g_score[nxt] = tentative_g
+                came_from[nxt] = (cur, e)
+                h = haversine_nm(lat[nxt], lon[nxt], g_lat, g_lon)
+                heapq.heappush(open_set, (tentative_g + h, tentative_g, nxt))
+                pushes += 1
+
+    if stats is not None:
+        stats["nodes_expanded"] = stats.get("nodes_expanded", 0) + expanded
+        stats["heap_pushes"] = stats.get("heap_pushes", 0) + pushes
+    if path is None:
+        return None, None
+    edges = [came_from[n][1] for n in path[1:]]
+    return path, edges
+
+
+def leaves_to_latlon(mesh, path, edges):
+    points = [(float(mesh.lat[path[0]]), float(mesh.lon[path[0]]))]
+    for leaf, e in zip(path[1:], edges):
+        points.append((float(mesh.portal_lat[e]), float(mesh.portal_lon[e])))
+        points.append((float(mesh.lat[leaf]), float(mesh.lon[leaf])))
+    return points
+
+
+def iter_navmesh_routes(mesh, start_latlon, end_latlon, bbox, ships=None, stats=None):
+    """Yield the main route, then the alternative, as lists of (lat, lon);
+    None where no route is found. The alternative is only searched when the
+    caller asks for it."""
+    allowed = mesh.leaves_in(**bbox)
+    start, goal = mesh.locate(*start_latlon), mesh.locate(*end_latlon)
+    path, edges = astar_leaves(mesh, start, goal, leaf_weights(mesh, allowed, ships), stats)
+    if path is None:
+        yield None
+        return
+    yield leaves_to_latlon(mesh, path, edges)
+    middle = path[len(path)//3:2*len(path)//3]
+    alt, alt_edges = astar_leaves(mesh, start, goal, leaf_weights(mesh, allowed, ships, middle), stats)
+    yield leaves_to_latlon(mesh, alt, alt_edges) if alt else None
+
+
+def navmesh_routes(mesh, start_latlon, end_latlon, bbox, ships=None, stats=None):
+    """Main and alternative routes as lists of (lat, lon)."""
+    routes = iter_navmesh_routes(mesh, start_latlon, end_latlon, bbox, ships, stats)
+    return next(routes), next(routes, None)
+
+
+if __name__ == "__main__":
+    # Main-route search only, against the uniform grid engine at app1.GRID_RES:
+    # nodes expanded and search time, with the per-request setup (weight grid
+    # rasterization / leaf weights) timed separately. The grid runs with the
+    # haversine bound (the one the navmesh uses) and with its default ALT bound.
+    import time
+    import app1
+
+    mesh = app1.NAV_MESH
+    sea_cells = int((~app1.GRID_PYRAMID.level(app1.GRID_RES).mask).sum())
+    print(f"navmesh: {mesh.node_count} leaves / {mesh.edge_count} edges (from the {mesh.res}° mask) "
+          f"vs {sea_cells} uniform sea cells at {app1.GRID_RES}°")
+    print(f"{'':>44} {'grid setup':>10} {'haversine':>18} {'alt':>18} | {'mesh setup':>10} {'navmesh':>18}")
+    ships = app1.get_ships_near_area(**app1.SEA_BOUNDS)
+    ports = app1.PORTS
+    for o, d in [(ports[0], ports[2]), (ports[1], ports[5]), (ports[0], ports[10]), (ports[84], ports[88])]:
+        start, end = (o["lat"], o["lon"]), (d["lat"], d["lon"])
+        bbox = {"lat_min": min(o["lat"], d["lat"])-3, "lat_max": max(o["lat"], d["lat"])+3,
+                "lon_min": min(o["lon"], d["lon"])-3, "lon_max": max(o["lon"], d["lon"])+3}
+        rmin, cmin = app1.latlon_to_grid(bbox["lat_min"], bbox["lon_min"])
+        rmax, cmax = app1.latlon_to_grid(bbox["lat_max"], bbox["lon_max"])
+        t = time.perf_counter()
+        grid, Rn, Cn = app1.build_weight_grid(rmin, rmax, cmin, cmax, dynamic_ships=ships)
+        t_grid_setup = time.perf_counter() - t
+        grid_runs = []
+        for search in ("haversine", "alt"):
+            stats = {}
+            t = time.perf_counter()
+            app1.weighted_a_star_sub(start, end, grid, rmin, cmin, Rn, Cn, stats, search)
+            grid_runs.append(f"{stats.get('nodes_expanded', 0):>7} {(time.perf_counter() - t)*1000:7.1f} ms")
+        t = time.perf_counter()
+        weights = leaf_weights(mesh, mesh.leaves_in(**bbox), ships)
+        first, goal = mesh.locate(*start), mesh.locate(*end)
+        t_mesh_setup = time.perf_counter() - t
+        stats = {}
+        t = time.perf_counter()
+        astar_leaves(mesh, first, goal, weights, stats)
+        t_mesh = time.perf_counter() - t
+        print(f"{o['name'][:20]:>20} -> {d['name'][:20]:<20} {t_grid_setup*1000:7.1f} ms "
+              f"{' '.join(grid_runs)} | {t_mesh_setup*1000:7.1f} ms "
+              f"{stats['nodes_expanded']:>7} {t_mesh*1000:7.1f} ms")
@@ -0,0 +1,102 @@
+# backend/path_simplify.py
+# Route post-processing: drop collinear grid points, obstacle-aware
+# Douglas-Peucker, and compact output encodings for the API.
+import numpy as np
+import shapely
+from shapely.geometry import box
+from shapely.strtree import STRtree
+
+SIMPLIFY_TOLERANCE_DEG = 0.02    # max lateral deviation of a shortcut (~1.2 nm)
+ROCK_CLEARANCE_DEG = 0.01
+ROUTE_FORMATS = ("points", "flat", "polyline")
+
+
+class ClearanceIndex:
+    """STRtree over the raw land polygons and (slightly grown) rocks."""
+
+    def __init__(self, obstacles, rocks, bounds):
+        area = box(bounds["lon_min"], bounds["lat_min"], bounds["lon_max"], bounds["lat_max"])
+        parts = list(shapely.get_parts(obstacles.intersection(area)))
+        parts += list(shapely.buffer(shapely.points(rocks.lon, rocks.lat), ROCK_CLEARANCE_DEG, quad_segs=2))
+        self.tree = STRtree(parts)
+
+    def clear(self, a, b):
+        """True when the straight leg a -> b ((lat, lon) tuples) touches no obstacle."""
+        line = shapely.linestrings([(a[1], a[0]), (b[1], b[0])])
+        return len(self.tree.query(line, predicate="intersects")) == 0
+
+
+def merge_collinear(points):
+    """Keep only the points where the heading changes."""
+    if len(points) < 3:
+        return list(points)
+    pts = np.asarray(points, dtype=np.float64)
+    d = np.diff(pts, axis=0)
+    turn = np.abs(d[:-1, 0]*d[1:, 1] - d[:-1, 1]*d[1:, 0]) > 1e-12
+    keep = np.concatenate([[True], turn, [True]])
+    return [points[i] for i in np.flatnonzero(keep)]
+
+
+def douglas_peucker(points, clearance=None, tolerance=SIMPLIFY_TOLERANCE_DEG):
+    """Douglas-Peucker that only accepts a shortcut when it is also clear of
+    obstacles. Legs of the input path are always kept as they are."""
+    n = len(points)
+    if n < 3:
+        return list(points)
+    pts = np.asarray(points, dtype=np.float64)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n-1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        a, b = pts[i], pts[j]
+        ab = b - a
+        seg = pts[i+1:j] - a
+        length = np.hypot(*ab)
+        if length > 0:
+            dev = np.abs(ab[0]*seg[:, 1] - ab[1]*seg[:, 0]) / length
+        else:
+            dev = np.hypot(seg[:, 0], seg[:, 1])
+        k = int(np.argmax(dev))
+        if dev[k] <= tolerance and (clearance is None or clearance.clear(points[i], points[j])):
+            continue
+        k += i + 1
+        keep[k] = True
+        stack.append((i, k))
+        stack.append((k, j))
+    return [points[i] for i in np.flatnonzero(keep)]
+
+
+def simplify_path(points, clearance=None, tolerance=SIMPLIFY_TOLERANCE_DEG):
+    if not points:
+        return points
+    return douglas_peucker(merge_collinear(points), clearance, tolerance)
+
+
+# ---------- Encodings ----------
+def encode_polyline(points, precision=5):
+    """Google encoded polyline of (lat, lon) points."""
+    factor = 10 ** precision
+    coords = np.round(np.asarray(points, dtype=np.float64) * factor).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=[[0, 0]]).ravel().tolist()
+    out = []
+    for v in deltas:
+        v = ~(v << 1) if v < 0 else v << 1
+        while v >= 0x20:
+            out.append(chr((0x20 | (v & 0x1f)) + 63))
+            v >>= 5
+        out.append(chr(v + 63))
+    return "".join(out)
+
+
+def encode_route(points, fmt="points"):
+    if not points:
+        return "" if fmt == "polyline" else []
+    if fmt == "polyline":
+        return encode_polyline(points)
+    rounded = np.round(np.asarray(points, dtype=np.float64), 6)
+    if fmt == "flat":
+        return rounded.ravel().tolist()
+    return [{"lat": lat, "lon": lon} for lat, lon in rounded.tolist()]
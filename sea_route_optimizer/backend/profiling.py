@@ -0,0 +1,162 @@
+# backend/profiling.py
+# On-demand profiling of single requests.
+#
+# A request asks for a profile with `?profile=1` (or an `X-Profile: 1` header)
+# and proves access with `X-Profile-Token`, which must match the
+# ROUTEURSEA_PROFILE_TOKEN environment variable; without that variable
+# profiling is off. Handlers wrapped in @profiled then run with a sampling
+# profiler attached to their thread: a daemon thread reads the handler's stack
+# through sys._current_frames() every SAMPLE_INTERVAL_S, so the handler runs
+# unmodified and the cost is paid only by profiled requests. The sampler needs
+# the GIL, so a long single C call (json encoding of the island features) gets
+# few samples; its time still shows in the profile's stage timings.
+#
+# Profiles are written to data/profiles/<id>.json with the call tree as text,
+# the stacks in collapsed format (flamegraph.pl / speedscope input) and the
+# stage timings and search counters of the request.
+import functools, hmac, json, os, sys, threading, time, uuid
+from collections import Counter
+from pathlib import Path
+
+from metrics import current
+
+PROFILE_TOKEN_ENV = "ROUTEURSEA_PROFILE_TOKEN"
+SAMPLE_INTERVAL_S = 0.001
+MAX_PROFILES = 50
+TREE_MIN_FRACTION = 0.01     # call-tree lines below 1% of samples are folded away
+
+
+def profile_token():
+    return os.environ.get(PROFILE_TOKEN_ENV) or None
+
+
+def profile_requested(query, headers):
+    """None when the request did not ask for a profile, else whether it is allowed."""
+    flag = query.get("profile") or headers.get("x-profile")
+    if flag not in ("1", "true", "yes"):
+        return None
+    token = profile_token()
+    supplied = headers.get("x-profile-token", "")
+    return bool(token) and hmac.compare_digest(token.encode(), supplied.encode())
+
+
+# ---------- Sampler ----------
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stack of one thread below (and including) the frame running `root_code`."""
+
+    def __init__(self, thread_id, root_code, interval=SAMPLE_INTERVAL_S):
+        self.thread_id, self.root_code, self.interval = thread_id, root_code, interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                if frame.f_code is self.root_code:
+                    self.samples[tuple(reversed(stack))] += 1
+                    break
+                frame = frame.f_back
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+
+def collapsed(samples):
+    """`frame;frame;frame count` lines, the flamegraph input format."""
+    return "\n".join(f"{';'.join(stack)} {n}" for stack, n in sorted(samples.items())) + "\n"
+
+
+def call_tree(samples, min_fraction=TREE_MIN_FRACTION):
+    """Indented call tree with inclusive sample counts and percentages."""
+    total = sum(samples.values())
+    if not total:
+        return "(no samples)\n"
+    tree = {}
+    for stack, n in samples.items():
+        node = tree
+        for name in stack:
+            entry = node.setdefault(name, [0, {}])
+            entry[0] += n
+            node = entry[1]
+
+    lines = [f"{total} samples"]
+    def walk(node, depth):
+        for name, (n, children) in sorted(node.items(), key=lambda kv: -kv[1][0]):
+            if n / total < min_fraction:
+                continue
+            lines.append(f"{'  ' * depth}{n / total * 100:5.1f}% {n:>6}  {name}")
+            walk(children, depth + 1)
+    walk(tree, 0)
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Storage ----------
+class ProfileStore:
+    def __init__(self, directory, keep=MAX_PROFILES):
+        self.directory, self.keep = Path(directory), keep
+
+    def save(self, profile):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{profile['id']}.json"
+        path.write_text(json.dumps(profile, ensure_ascii=False), encoding="utf-8")
+        old = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)[:-self.keep]
+        for p in old:
+            p.unlink(missing_ok=True)
+        return path
+
+    def load(self, profile_id):
+        path = self.directory / f"{profile_id}.json"
+        if not profile_id.replace("-", "").isalnum() or not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+
+def profiled(fn):
+    """Run a (sync) handler under the sampler when its request asked for it.
+    The profile is left on the request's metrics as `m.profile`."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        m = current()
+        if m is None or not m.profile_requested:
+            return fn(*args, **kwargs)
+        with StackSampler(threading.get_ident(), fn.__code__) as sampler:
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                m.profile = sampler
+    wrapper.profiled = True
+    return wrapper
+
+
+def is_profiled(endpoint):
+    return getattr(endpoint, "profiled", False)
+
+
+def build_profile(route, sampler, m):
+    samples = sampler.samples
+    return {
+        "id": f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}",
+        "route": route,
+        "elapsed_ms": round(sampler.elapsed * 1000, 3),
+        "interval_ms": sampler.interval * 1000,
+        "samples": sum(samples.values()),
+        "stages_ms": {k: round(v * 1000, 3) for k, v in m.stages.items()},
+        "counters": dict(m.counters),
+        "call_tree": call_tree(samples),
+        "collapsed": collapsed(samples),
+    }
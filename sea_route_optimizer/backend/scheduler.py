@@ -0,0 +1,127 @@
+# backend/scheduler.py
+# Admission control for CPU-heavy endpoints.
+#
+# Each scheduled request gets a cost estimate (roughly "milliseconds of CPU")
+# and a class. Every class has its own concurrency limit, a bounded wait queue
+# served cheapest-first (with aging), and a maximum queueing time; a request that finds its
+# queue full, or waits too long, is shed with 503 + Retry-After instead of
+# piling up on the worker threads. Endpoints that are not scheduled (ports,
+# /api/calculate, static files, pages) never wait behind routing work, and the
+# small-route class has its own slots, so a burst of long-haul routes cannot
+# starve short interactive ones.
+#
+# Waiting happens on the event loop (an async FastAPI dependency), before the
+# sync handler is handed to a worker thread, so queued requests hold no thread.
+import asyncio, heapq, itertools, math, time
+
+from metrics import Counter, Histogram, STAGE_BUCKETS, METRIC_PREFIX
+
+# Estimated CPU (ms) of a route request, fitted to /api/optimize-route timings
+# (bench-style runs, 14 port pairs x engines x pyramid levels): per cell of the
+# search window and per cell along the route, both at the resolution the
+# engine searches at. The legacy grid rasterizes its whole window in Python;
+# the pyramid's refinement corridors follow the route, so its cost grows with
+# route length / resolution (~9x from 0.2° to 0.025°). Overlays are encoded
+# once at startup, so the fixed part is small.
+ENGINE_MS_PER_CELL = {"grid": 0.017, "pyramid": 0.0001, "quadtree": 0.0001, "visgraph": 0.0}
+ENGINE_MS_PER_PATH_CELL = {"grid": 0.03, "pyramid": 0.085, "quadtree": 0.06, "visgraph": 0.18}
+BASE_ROUTE_MS = 4.0
+HEAVY_ROUTE_MS = 100.0    # routes estimated above this go to the "heavy" class
+
+
+class SchedulerClass:
+    def __init__(self, name, concurrency, max_queue, max_wait_s):
+        self.name, self.concurrency, self.max_queue, self.max_wait_s = name, concurrency, max_queue, max_wait_s
+        self.running = 0
+        self.waiting = []     # heap of (priority, seq, future)
+
+
+# name -> (concurrency, max queue length, max wait seconds)
+DEFAULT_CLASSES = {
+    "route": (4, 32, 10.0),
+    "heavy": (2, 8, 30.0),
+    "batch": (1, 4, 60.0),
+}
+
+
+class Overloaded(Exception):
+    def __init__(self, cls, reason, retry_after):
+        super().__init__(f"{cls}: {reason}")
+        self.cls, self.reason, self.retry_after = cls, reason, retry_after
+
+
+class Scheduler:
+    def __init__(self, classes=DEFAULT_CLASSES):
+        self.classes = {name: SchedulerClass(name, *cfg) for name, cfg in classes.items()}
+        self._seq = itertools.count()
+        p = METRIC_PREFIX
+        self.wait = Histogram(f"{p}_queue_wait_seconds", "Time spent queued before admission.", STAGE_BUCKETS, ("class",))
+        self.admitted = Counter(f"{p}_admitted_total", "Requests admitted by the scheduler.", ("class",))
+        self.shed = Counter(f"{p}_shed_total", "Requests rejected by the scheduler.", ("class", "reason"))
+
+    async def acquire(self, cls_name, cost):
+        """Wait for a slot in `cls_name`; raises Overloaded when shedding.
+
+        Waiters are served by arrival time plus estimated cost, i.e. cheapest
+        first, but a request never stays behind ones that arrived much later."""
+        cls = self.classes[cls_name]
+        t = time.perf_counter()
+        if cls.running < cls.concurrency and not cls.waiting:
+            cls.running += 1
+        else:
+            if len(cls.waiting) >= cls.max_queue:
+                self.shed.inc(1, cls_name, "queue_full")
+                raise Overloaded(cls_name, "queue full", self.retry_after(cls))
+            fut = asyncio.get_running_loop().create_future()
+            entry = (t + cost / 1000.0, next(self._seq), fut)
+            heapq.heappush(cls.waiting, entry)
+            try:
+                await asyncio.wait_for(fut, cls.max_wait_s)
+            except BaseException as e:   # timeout, or the client went away
+                if fut.done() and not fut.cancelled():
+                    self.release(cls_name)          # granted while giving up: pass the slot on
+                elif entry in cls.waiting:
+                    cls.waiting.remove(entry)
+                    heapq.heapify(cls.waiting)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.shed.inc(1, cls_name, "timeout")
+                    raise Overloaded(cls_name, "queue timeout", self.retry_after(cls)) from None
+                raise
+        self.wait.observe(time.perf_counter() - t, cls_name)
+        self.admitted.inc(1, cls_name)
+
+    def release(self, cls_name):
+        cls = self.classes[cls_name]
+        while cls.waiting:
+            _, _, fut = heapq.heappop(cls.waiting)
+            if not fut.done():
+                fut.set_result(True)    # the slot passes straight to the next waiter
+                return
+        cls.running -= 1
+
+    def retry_after(self, cls):
+        return max(1, math.ceil(cls.max_wait_s / 4))
+
+    def expose(self):
+        p = METRIC_PREFIX
+        lines = self.wait.expose() + self.admitted.expose() + self.shed.expose()
+        for metric, help_text, attr in ((f"{p}_queue_depth", "Requests waiting for a slot.", "waiting"),
+                                        (f"{p}_in_flight", "Requests holding a slot.", "running")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for name, cls in self.classes.items():
+                value = getattr(cls, attr)
+                lines.append(f'{metric}{{class="{name}"}} {len(value) if isinstance(value, list) else value}')
+        return "\n".join(lines) + "\n"
+
+
+def estimate_route_cost(engine, bbox, distance_nm, grid_res):
+    """Rough CPU cost (ms) of a route request from its window and port distance,
+    at the resolution (degrees) the engine searches at."""
+    engine = engine if engine in ENGINE_MS_PER_CELL else "grid"
+    cells = (bbox["lat_max"] - bbox["lat_min"]) * (bbox["lon_max"] - bbox["lon_min"]) / grid_res ** 2
+    path_cells = distance_nm / 60.0 / grid_res
+    return BASE_ROUTE_MS + cells * ENGINE_MS_PER_CELL[engine] + path_cells * ENGINE_MS_PER_PATH_CELL[engine]
+
+
+def route_class(cost):
+    return "heavy" if cost >= HEAVY_ROUTE_MS else "route"
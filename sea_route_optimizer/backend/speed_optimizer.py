@@ -0,0 +1,90 @@
+# backend/speed_optimizer.py
+# Minimum-CO2 speed plan under an arrival deadline.
+#
+# Per (vessel, fuel) the fuel model of compute_fuel is swept once over a dense
+# speed grid and cached. A plan is chosen with a Lagrangian relaxation: for a
+# price `lam` on time, every segment independently picks the speed minimizing
+# co2 + lam * hours; `lam` is bisected until the plan just meets the deadline.
+# Below half the nominal speed the fuel model is flat per nm, so equal-cost
+# speeds are common; ties go to the highest speed (no CO2 saved by going slower).
+import numpy as np
+
+from fleet_emissions import fuel_kernel
+
+SPEED_MIN, SPEED_MAX, SPEED_STEP = 4.0, 30.0, 0.05   # knots, same clamps as /api/calculate
+BISECT_STEPS = 60
+TIE_RTOL = 1e-9
+
+
+class SpeedCurves:
+    def __init__(self, tables):
+        self.tables = tables
+        self.speeds = np.arange(SPEED_MIN, SPEED_MAX + SPEED_STEP/2, SPEED_STEP)
+        self.hours_per_nm = 1.0 / self.speeds
+        self._cache = {}
+
+    def curve(self, vessel_type, fuel_type):
+        """(fuel litres per nm, kg CO2 per nm) at each grid speed, in calm weather."""
+        t = self.tables
+        vt = t.vessel_index.get(vessel_type, t.default_vessel)
+        ft = t.fuel_index.get(fuel_type, t.default_fuel)
+        key = (vt, ft)
+        if key not in self._cache:
+            fuel = fuel_kernel(t.base_rate[vt], t.nominal_speed[vt], self.speeds, 1.0, 1.0)
+            self._cache[key] = (fuel, fuel * t.ef[ft])
+        return self._cache[key]
+
+
+def _pick(co2_nm, hours_nm, distance, resistance, lam):
+    """Speed index per segment minimizing co2 + lam * hours; the fastest of tied speeds."""
+    cost = (distance * resistance)[:, None] * co2_nm[None, :] + lam * distance[:, None] * hours_nm[None, :]
+    best = cost.min(axis=1, keepdims=True)
+    tied = cost <= best + TIE_RTOL * np.abs(best)
+    return cost.shape[1] - 1 - np.argmax(tied[:, ::-1], axis=1)
+
+
+def optimize_speed_plan(curves, vessel_type, fuel_type, distances, deadline_hours, resistances=None):
+    distance = np.asarray(distances, dtype=np.float64)
+    resistance = np.ones_like(distance) if resistances is None else np.asarray(resistances, dtype=np.float64)
+    fuel_nm, co2_nm = curves.curve(vessel_type, fuel_type)
+    hours_nm = curves.hours_per_nm
+    speeds = curves.speeds
+
+    def plan_hours(idx):
+        return float((distance * hours_nm[idx]).sum())
+
+    fastest = np.full(len(distance), len(speeds) - 1)
+    feasible = plan_hours(fastest) <= deadline_hours
+    idx = _pick(co2_nm, hours_nm, distance, resistance, 0.0)
+    if not feasible:
+        idx = fastest
+    elif plan_hours(idx) > deadline_hours:
+        # Grow the time price until the plan fits, then bisect it down.
+        lo, hi = 0.0, 1.0
+        while plan_hours(_pick(co2_nm, hours_nm, distance, resistance, hi)) > deadline_hours:
+            hi *= 4.0
+        for _ in range(BISECT_STEPS):
+            mid = (lo + hi) / 2
+            if plan_hours(_pick(co2_nm, hours_nm, distance, resistance, mid)) > deadline_hours:
+                lo = mid
+            else:
+                hi = mid
+        idx = _pick(co2_nm, hours_nm, distance, resistance, hi)
+
+    seg_fuel = fuel_nm[idx] * distance * resistance
+    seg_co2 = co2_nm[idx] * distance * resistance
+    seg_hours = distance * hours_nm[idx]
+    return {
+        "feasible": bool(feasible),
+        "total_distance_nm": round(float(distance.sum()), 2),
+        "total_fuel_liters": round(float(seg_fuel.sum()), 2),
+        "total_co2_kg": round(float(seg_co2.sum()), 2),
+        "eta_hours": round(float(seg_hours.sum()), 2),
+        "deadline_hours": deadline_hours,
+        "segments": [
+            {"distance_nm": round(d, 2), "weather_resistance": r, "speed_knots": round(v, 2),
+             "fuel_liters": round(f, 2), "co2_kg": round(c, 2), "hours": round(h, 2)}
+            for d, r, v, f, c, h in zip(distance.tolist(), resistance.tolist(), speeds[idx].tolist(),
+                                        seg_fuel.tolist(), seg_co2.tolist(), seg_hours.tolist())
+        ],
+    }
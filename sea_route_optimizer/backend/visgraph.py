@@ -0,0 +1,262 @@
+# backend/visgraph.py
+# Visibility-graph routing over simplified, buffered obstacle polygons.
+#
+# Nodes are the convex vertices of the obstacles grown by SAFETY_MARGIN_DEG,
+# plus a sparse lattice of open-sea relay nodes; edges join mutually visible
+# nodes whose segment is tangent to both end polygons (only those can lie on
+# a shortest path). Line-of-sight is tested
+# against slightly thinner copies of the obstacles held in an STRtree, so
+# segments that graze a node polygon are not rejected.
+import os, heapq, logging
+from pathlib import Path
+import numpy as np
+import shapely
+from shapely.geometry import Point, Polygon, LineString, box
+from shapely.strtree import STRtree
+
+from geo import haversine_nm, haversine_nm_np
+
+SAFETY_MARGIN_DEG = 0.05      # ~3 nm clearance around land and rocks
+SIMPLIFY_DEG = 0.004          # must stay well below SAFETY_MARGIN_DEG / 10
+LOS_MARGIN_DEG = SAFETY_MARGIN_DEG * 0.8
+MAX_EDGE_DEG = 8.0            # longest precomputed edge; longer legs chain through nodes
+LATTICE_DEG = 4.0             # open-sea relay nodes keep the graph connected across wide gaps
+PORT_CLEARANCE_DEG = SAFETY_MARGIN_DEG * 1.5   # ignore obstacles this close to a port
+ALT_PENALTY = 200.0
+
+
+class VisibilityGraph:
+    def __init__(self, lon, lat, indptr, indices, blockers):
+        self.lon, self.lat = lon, lat
+        self.indptr, self.indices = indptr, indices
+        src = np.repeat(np.arange(len(lon)), np.diff(indptr))
+        self.edge_nm = haversine_nm_np(lat[src], lon[src], lat[indices], lon[indices])
+        self.blockers = blockers                 # array of LOS polygons
+        self.tree = STRtree(blockers)
+        self.node_tree = STRtree(shapely.points(lon, lat))
+
+    @property
+    def node_count(self):
+        return len(self.lon)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def visible(self, lines):
+        """Boolean array: which of `lines` cross no obstacle."""
+        hit = self.tree.query(lines, predicate="intersects")
+        ok = np.ones(len(lines), dtype=bool)
+        ok[hit[0]] = False
+        return ok
+
+    def save(self, path, key=""):
+        wkb = shapely.to_wkb(shapely.multipolygons(self.blockers))
+        np.savez_compressed(path, lon=self.lon, lat=self.lat, indptr=self.indptr, indices=self.indices,
+                            blockers=np.frombuffer(wkb, dtype=np.uint8), key=np.array(key))
+
+    @classmethod
+    def load(cls, path, key=""):
+        with np.load(path) as d:
+            if str(d["key"]) != key:
+                return None
+            blockers = shapely.get_parts(shapely.from_wkb(d["blockers"].tobytes()))
+            return cls(d["lon"], d["lat"], d["indptr"], d["indices"], blockers)
+
+
+# ---------- Build ----------
+def _fill(geom):
+    parts = shapely.get_parts(geom)
+    return [Polygon(p.exterior) for p in parts if not p.is_empty]
+
+
+def _convex_vertices(polys):
+    """Convex exterior vertices of each polygon with their ring neighbours."""
+    pts, prev, nxt = [], [], []
+    for poly in polys:
+        ring = np.asarray(shapely.geometry.polygon.orient(poly, 1.0).exterior.coords)[:-1]
+        if len(ring) < 3:
+            continue
+        p, n = np.roll(ring, 1, axis=0), np.roll(ring, -1, axis=0)
+        a, b = ring - p, n - ring
+        convex = a[:, 0]*b[:, 1] - a[:, 1]*b[:, 0] > 0     # left turn on a CCW ring
+        pts.append(ring[convex]); prev.append(p[convex]); nxt.append(n[convex])
+    return np.concatenate(pts), np.concatenate(prev), np.concatenate(nxt)
+
+
+def _cross(o, a, b):
+    return (a[:, 0]-o[:, 0])*(b[:, 1]-o[:, 1]) - (a[:, 1]-o[:, 1])*(b[:, 0]-o[:, 0])
+
+
+def _tangent(v, prev, nxt, w):
+    """Segment v->w leaves both ring neighbours of v on the same side."""
+    s1, s2 = _cross(v, w, prev), _cross(v, w, nxt)
+    return s1 * s2 >= 0
+
+
+def _lattice(bounds, blockers, step=LATTICE_DEG):
+    lats = np.arange(bounds["lat_min"] + step/2, bounds["lat_max"], step)
+    lons = np.arange(bounds["lon_min"] + step/2, bounds["lon_max"], step)
+    lon_grid, lat_grid = np.meshgrid(lons, lats)
+    pts = np.stack([lon_grid.ravel(), lat_grid.ravel()], axis=1)
+    return pts[~shapely.contains_xy(blockers, pts[:, 0], pts[:, 1])]
+
+
+def build_visgraph(obstacles, rocks, bounds, margin=SAFETY_MARGIN_DEG, tolerance=SIMPLIFY_DEG, max_edge=MAX_EDGE_DEG):
+    area = box(bounds["lon_min"], bounds["lat_min"], bounds["lon_max"], bounds["lat_max"])
+    hazards = [obstacles.intersection(area.buffer(1.0))] + list(shapely.points(rocks.lon, rocks.lat))
+    grown = shapely.union_all([shapely.buffer(h, margin, quad_segs=2) for h in hazards]).simplify(tolerance)
+    los = shapely.union_all([shapely.buffer(h, LOS_MARGIN_DEG, quad_segs=2) for h in hazards]).simplify(tolerance)
+    grown, los = grown.intersection(area), los.intersection(area)
+    blockers = np.array(_fill(los))
+
+    pts, prev, nxt = _convex_vertices(_fill(grown))
+    # Drop vertices swallowed by a neighbouring grown polygon.
+    blocked = shapely.union_all(blockers)
+    keep = ~shapely.contains_xy(blocked, pts[:, 0], pts[:, 1])
+    # Relay nodes are their own ring neighbours, so every segment is "tangent" at them.
+    relays = _lattice(bounds, blocked)
+    pts = np.concatenate([pts[keep], relays])
+    prev = np.concatenate([prev[keep], relays])
+    nxt = np.concatenate([nxt[keep], relays])
+
+    node_tree = STRtree(shapely.points(pts))
+    i, j = node_tree.query(shapely.points(pts), predicate="dwithin", distance=max_edge)
+    half = i < j
+    i, j = i[half], j[half]
+    bitangent = _tangent(pts[i], prev[i], nxt[i], pts[j]) & _tangent(pts[j], prev[j], nxt[j], pts[i])
+    i, j = i[bitangent], j[bitangent]
+
+    graph_tree = STRtree(blockers)
+    lines = shapely.linestrings(np.stack([pts[i], pts[j]], axis=1))
+    hit = graph_tree.query(lines, predicate="intersects")[0]
+    ok = np.ones(len(lines), dtype=bool)
+    ok[hit] = False
+    i, j = i[ok], j[ok]
+
+    src, dst = np.concatenate([i, j]), np.concatenate([j, i])
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(len(pts)+1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(pts)), out=indptr[1:])
+    return VisibilityGraph(pts[:, 0].copy(), pts[:, 1].copy(), indptr, dst[order].astype(np.int32), blockers)
+
+
+def load_or_build_visgraph(cache_path, obstacles, rocks, bounds, key=""):
+    cache_path = Path(cache_path)
+    key = f"{key}|{SAFETY_MARGIN_DEG}|{SIMPLIFY_DEG}|{MAX_EDGE_DEG}|{LATTICE_DEG}"
+    if cache_path.exists():
+        try:
+            graph = VisibilityGraph.load(cache_path, key)
+            if graph is not None:
+                return graph
+        except Exception as e:
+            logging.warning("Ignoring unreadable visibility graph cache %s: %s", cache_path, e)
+
+    graph = build_visgraph(obstacles, rocks, bounds)
+    os.makedirs(cache_path.parent, exist_ok=True)
+    graph.save(cache_path, key)
+    logging.info("Built visibility graph: %d nodes, %d edges -> %s", graph.node_count, graph.edge_count, cache_path)
+    return graph
+
+
+# ---------- Query ----------
+def _port_links(graph, lon, lat):
+    """Visible graph nodes from a port, as (node, nm) pairs. Obstacles within
+    PORT_CLEARANCE_DEG of the port are ignored, as ports sit on the coast."""
+    cand = graph.node_tree.query(Point(lon, lat), predicate="dwithin", distance=MAX_EDGE_DEG)
+    if not len(cand):
+        return []
+    clon, clat = graph.lon[cand], graph.lat[cand]
+    d = np.hypot(clon - lon, clat - lat)
+    f = np.minimum(1.0, PORT_CLEARANCE_DEG / np.maximum(d, 1e-12))
+    starts = np.stack([lon + (clon - lon)*f, lat + (clat - lat)*f], axis=1)
+    lines = shapely.linestrings(np.stack([starts, np.stack([clon, clat], axis=1)], axis=1))
+    ok = graph.visible(lines) | (d <= PORT_CLEARANCE_DEG)
+    nm = haversine_nm_np(lat, lon, clat[ok], clon[ok])
+    return list(zip(cand[ok].tolist(), nm.tolist()))
+
+
+def _direct_visible(graph, a, b):
+    (lat1, lon1), (lat2, lon2) = a, b
+    d = np.hypot(lon2 - lon1, lat2 - lat1)
+    if d <= 2 * PORT_CLEARANCE_DEG:
+        return True
+    f = PORT_CLEARANCE_DEG / d
+    line = LineString([(lon1 + (lon2-lon1)*f, lat1 + (lat2-lat1)*f),
+                       (lon2 - (lon2-lon1)*f, lat2 - (lat2-lat1)*f)])
+    return bool(graph.visible([line])[0])
+
+
+def astar_visgraph(graph, start_latlon, end_latlon, penalized=(), stats=None):
+    """Shortest path from start to end through the graph. Start and end are
+    temporary nodes N and N+1. Returns a list of (lat, lon) or None."""
+    N = graph.node_count
+    S, E = N, N + 1
+    (s_lat, s_lon), (e_lat, e_lon) = start_latlon, end_latlon
+    extra = {S: _port_links(graph, s_lon, s_lat)}
+    for node, nm in _port_links(graph, e_lon, e_lat):
+        extra.setdefault(node, []).append((E, nm))
+    if _direct_visible(graph, start_latlon, end_latlon):
+        extra[S].append((E, haversine_nm(s_lat, s_lon, e_lat, e_lon)))
+
+    lat, lon = graph.lat.tolist() + [s_lat, e_lat], graph.lon.tolist() + [s_lon, e_lon]
+    indptr, indices, edge_nm = graph.indptr, graph.indices, graph.edge_nm
+    penalized = set(penalized)
+
+    inf = float("inf")
+    g_score = {S: 0.0}
+    came_from = {}
+    open_set = [(0.0, 0.0, S)]
+    expanded = pushes = 0
+    path = None
+    while open_set:
+        _, g_cur, cur = heapq.heappop(open_set)
+        if g_cur > g_score.get(cur, inf):
+            continue
+        expanded += 1
+        if cur == E:
+            path = [cur]
+            while cur in came_from:
+                cur = came_from[cur]
+                path.append(cur)
+            path.reverse()
+            break
+        nbrs = list(extra.get(cur, ()))
+        if cur < N:
+            lo, hi = indptr[cur], indptr[cur+1]
+            nbrs += zip(indices[lo:hi].tolist(), edge_nm[lo:hi].tolist())
+        for nxt, step in nbrs:
+            if (cur, nxt) in penalized:
+                step *= ALT_PENALTY
+            tentative_g = g_cur + step
+            if tentative_g < g_score.get(nxt, inf):
+                g_score[nxt] = tentative_g
+                came_from[nxt] = cur
+                heapq.heappush(open_set, (tentative_g + haversine_nm(lat[nxt], lon[nxt], e_lat, e_lon),
+                                          tentative_g, nxt))
+                pushes += 1
+
+    if stats is not None:
+        stats["nodes_expanded"] = stats.get("nodes_expanded", 0) + expanded
+        stats["heap_pushes"] = stats.get("heap_pushes", 0) + pushes
+    return path, [(lat[n], lon[n]) for n in path] if path else None
+
+
+def iter_visgraph_routes(graph, start_latlon, end_latlon, stats=None):
+    """Yield the main route, then an alternative that avoids the middle third
+    of its legs; None where no route is found."""
+    nodes, path_main = astar_visgraph(graph, start_latlon, end_latlon, stats=stats)
+    if not path_main:
+        yield None
+        return
+    yield path_main
+    legs = list(zip(nodes, nodes[1:]))
+    middle = legs[len(legs)//3:max(2*len(legs)//3, len(legs)//3 + 1)]
+    _, path_alt = astar_visgraph(graph, start_latlon, end_latlon, penalized=middle, stats=stats)
+    yield path_alt
+
+
+def visgraph_routes(graph, start_latlon, end_latlon, stats=None):
+    """Main route plus an alternative that avoids the middle third of its legs."""
+    routes = iter_visgraph_routes(graph, start_latlon, end_latlon, stats)
+    return next(routes), next(routes, None)
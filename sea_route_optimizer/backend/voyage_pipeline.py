@@ -0,0 +1,49 @@
+# backend/voyage_pipeline.py
+# Per-segment fuel / CO2 / ETA along a computed route, in one NumPy pass
+# (segments x scenarios) instead of one compute_fuel call per waypoint.
+import numpy as np
+
+from geo import haversine_nm_np
+from fleet_emissions import fuel_kernel, scenario_speeds
+
+MAX_SEGMENT_DEG = 1.0     # long legs are split so sea state is sampled along them
+
+
+def densify(path, max_step=MAX_SEGMENT_DEG):
+    """(lat, lon) path -> (lats, lons) arrays with no leg longer than max_step degrees."""
+    pts = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 2:        # origin and destination in the same cell: no legs
+        return pts[:, 0], pts[:, 1]
+    steps = np.maximum(1, np.ceil(np.abs(np.diff(pts, axis=0)).max(axis=1) / max_step)).astype(int)
+    t = np.concatenate([np.arange(n) / n for n in steps])
+    leg = np.repeat(np.arange(len(steps)), steps)
+    dense = pts[leg] + (pts[leg+1] - pts[leg]) * t[:, None]
+    dense = np.vstack([dense, pts[-1:]])
+    return dense[:, 0], dense[:, 1]
+
+
+def route_segments(path):
+    """Segment lengths (nm) and midpoints of a (lat, lon) path; empty arrays
+    for a path of fewer than two points."""
+    lat, lon = densify(path)
+    nm = haversine_nm_np(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    return nm, (lat[:-1] + lat[1:]) / 2, (lon[:-1] + lon[1:]) / 2
+
+
+def segment_emissions(tables, vessel_type, fuel_type, speed_knots, seg_nm, resistance):
+    """Fuel, CO2 and hours for every (segment, scenario) pair.
+
+    Returns (labels, speeds, fuel, co2, hours); the last three are arrays of
+    shape (segments, scenarios)."""
+    vt = tables.vessel_index.get(vessel_type, tables.default_vessel)
+    ft = tables.fuel_index.get(fuel_type, tables.default_fuel)
+    nominal = tables.nominal_speed[vt]
+    speeds = scenario_speeds(max(speed_knots, 1.0), nominal)
+    labels = list(speeds)
+    v = np.array([speeds[k] for k in labels], dtype=np.float64)
+
+    seg_nm = np.asarray(seg_nm, dtype=np.float64)[:, None]
+    fuel = fuel_kernel(tables.base_rate[vt], nominal, v[None, :], seg_nm, np.asarray(resistance)[:, None])
+    co2 = fuel * tables.ef[ft]
+    hours = seg_nm / v[None, :]
+    return labels, v, fuel, co2, hours
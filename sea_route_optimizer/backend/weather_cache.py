@@ -0,0 +1,76 @@
+# backend/weather_cache.py
+# Cached sea state for route segments: one Open-Meteo marine lookup per
+# WEATHER_CELL_DEG cell, kept for WEATHER_TTL_S and shared by all requests.
+# Failed lookups (network errors, bad responses) are only kept for
+# WEATHER_RETRY_S, so an outage does not pin calm weather for the full TTL.
+import time, threading, logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+from metrics import count
+
+MARINE_URL = "https://marine-api.open-meteo.com/v1/marine"
+WEATHER_CELL_DEG = 1.0
+WEATHER_TTL_S = 3600
+WEATHER_RETRY_S = 60
+FETCH_WORKERS = 8
+WAVE_RESISTANCE_PER_M = 0.05     # +5% fuel per metre of significant wave height
+MAX_RESISTANCE = 1.5
+
+
+def fetch_wave_height(lat, lon):
+    """Mean forecast wave height (m) over the next 24 h, or None."""
+    res = requests.get(MARINE_URL, params={"latitude": lat, "longitude": lon, "hourly": "wave_height",
+                                           "forecast_days": 1, "timezone": "auto"}, timeout=5).json()
+    heights = [h for h in res.get("hourly", {}).get("wave_height", []) if h is not None]
+    return sum(heights) / len(heights) if heights else None
+
+
+class WeatherCache:
+    def __init__(self, fetch=fetch_wave_height, cell=WEATHER_CELL_DEG, ttl=WEATHER_TTL_S,
+                 retry=WEATHER_RETRY_S):
+        self.fetch = fetch
+        self.cell = cell
+        self.ttl = ttl
+        self.retry = retry
+        self._data = {}          # key -> (expires at, wave height or None)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _key(self, lat, lon):
+        return round(lat / self.cell), round(lon / self.cell)
+
+    def _load(self, key):
+        lat, lon = key[0] * self.cell, key[1] * self.cell
+        try:
+            return key, self.fetch(lat, lon), self.ttl
+        except Exception as e:
+            logging.warning("Wave height lookup failed at %.1f,%.1f: %s", lat, lon, e)
+            return key, None, self.retry
+
+    def wave_heights(self, lats, lons):
+        """Wave height (m) at each point; NaN where no data is available."""
+        keys = [self._key(lat, lon) for lat, lon in zip(lats, lons)]
+        now = time.monotonic()
+        with self._lock:
+            missing = {k for k in keys if k not in self._data or now >= self._data[k][0]}
+            self.misses += len(missing)
+            self.hits += len(set(keys)) - len(missing)
+        count("weather_cache_misses", len(missing))
+        count("weather_cache_hits", len(set(keys)) - len(missing))
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(missing))) as pool:
+                fetched = list(pool.map(self._load, missing))
+            with self._lock:
+                for key, value, ttl in fetched:
+                    self._data[key] = (now + ttl, value)
+        with self._lock:
+            values = [self._data[k][1] for k in keys]
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def wave_resistance(wave_heights):
+    """Weather resistance multiplier from wave height; calm (1.0) where unknown."""
+    h = np.nan_to_num(np.asarray(wave_heights, dtype=np.float64), nan=0.0)
+    return np.clip(1.0 + WAVE_RESISTANCE_PER_M * h, 1.0, MAX_RESISTANCE)
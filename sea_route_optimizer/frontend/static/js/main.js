@@ -55,6 +55,28 @@ async function loadPorts(){
   }
 }
 
+// Google encoded polyline -> [{lat, lon}] (routes are requested with format "polyline")
+function decodePolyline(str, precision = 5){
+  const factor = Math.pow(10, precision);
+  const coords = [];
+  let index = 0, lat = 0, lon = 0;
+  while(index < str.length){
+    const deltas = [];
+    for(let k = 0; k < 2; k++){
+      let result = 0, shift = 0, b;
+      do {
+        b = str.charCodeAt(index++) - 63;
+        result |= (b & 0x1f) << shift;
+        shift += 5;
+      } while(b >= 0x20);
+      deltas.push((result & 1) ? ~(result >> 1) : (result >> 1));
+    }
+    lat += deltas[0]; lon += deltas[1];
+    coords.push({ lat: lat / factor, lon: lon / factor });
+  }
+  return coords;
+}
+
 function drawRoute(coords, opts){
   const latlngs = coords.map(p => [p.lat, p.lon]);
   const poly = L.polyline(latlngs, opts).addTo(map);
@@ -129,37 +151,67 @@ function markPortsOnMap(origin, destination){
 }
 
 
+// Reads an NDJSON response as it arrives, calling onEvent for every line
+async function readNDJSON(res, onEvent){
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  while(true){
+    const { value, done } = await reader.read();
+    if(done) break;
+    buf += decoder.decode(value, { stream: true });
+    let nl;
+    while((nl = buf.indexOf("\n")) >= 0){
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if(line) onEvent(JSON.parse(line));
+    }
+  }
+  if(buf.trim()) onEvent(JSON.parse(buf));
+}
+
+// Route page renders incrementally: main route first, then the alternative, then overlays
 async function computeRoute(){
   const origin = originSelect.value, destination = destSelect.value;
   if(!origin || !destination){ alert("Select both ports"); return; }
   statusDiv.innerText = "Computing...";
   console.log("Compute request", { origin, destination });
   try{
-    const res = await fetch('/api/optimize-route', {
+    const res = await fetch('/api/optimize-route/stream', {
       method: 'POST',
       headers: {'Content-Type':'application/json'},
-      body: JSON.stringify({ origin, destination })
+      body: JSON.stringify({ origin, destination, format: "polyline" })
     });
-    const data = await res.json();
-    console.log("Server response", res.status, data);
     if(res.status !== 200){
-      statusDiv.innerText = data.error || "Server error";
+      const data = await res.json().catch(() => ({}));
+      console.log("Server response", res.status, data);
+      statusDiv.innerText = data.detail || data.error || "Server error";
       return;
     }
     clearDynamic();
-    // draw obstacles
-    drawObstacles(data.obstacles);
-    // draw routes
-    if(data.main_route && data.main_route.length){
-      drawRoute(data.main_route, { color:"#0066ff", weight:4, opacity:0.95 });
-      map.fitBounds(data.main_route.map(p => [p.lat, p.lon]), { padding: [20,20] });
-    } else {
-      console.warn("No main_route returned");
-    }
-    if(data.alt_route && data.alt_route.length){
-      drawRoute(data.alt_route, { color:"#ff7f50", weight:3, dashArray:"8,6" });
-    }
-    statusDiv.innerText = "Routes displayed";
+    const routeLayers = [];
+    await readNDJSON(res, ev => {
+      console.log("Route event", ev.event, ev.kind || ev.layer || "", ev.elapsed_ms);
+      if(ev.event === "route"){
+        const coords = decodePolyline(ev.route || "");
+        if(ev.kind === "main"){
+          if(coords.length){
+            routeLayers.push(drawRoute(coords, { color:"#0066ff", weight:4, opacity:0.95 }));
+            map.fitBounds(coords.map(p => [p.lat, p.lon]), { padding: [20,20] });
+          } else {
+            console.warn("No main_route returned");
+          }
+          statusDiv.innerText = "Main route displayed, loading alternative...";
+        } else if(coords.length){
+          routeLayers.push(drawRoute(coords, { color:"#ff7f50", weight:3, dashArray:"8,6" }));
+        }
+      } else if(ev.event === "overlay"){
+        drawObstacles({ [ev.layer]: ev.features });
+        routeLayers.forEach(l => l.bringToFront());   // overlays arrive after the routes
+      } else if(ev.event === "done"){
+        statusDiv.innerText = "Routes displayed";
+      }
+    });
   } catch(err){
     console.error("computeRoute error", err);
     statusDiv.innerText = "Error computing route";